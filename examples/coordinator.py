@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from spider_rs import Coordinator, Website
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Serve 40 linked pages."""
+
+    def do_GET(self) -> None:
+        page = int(self.path.strip("/") or 0)
+        body = "".join(f'<a href="/{page * 4 + i}">{i}</a>' for i in range(1, 5) if page * 4 + i < 40)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(f"<html><body>{body}</body></html>".encode())
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+async def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    website: Website = Website(url).with_depth(10).with_page_fields(["url", "status_code"])
+    coordinator: Coordinator = Coordinator(website, 4).with_shard_by("url")
+    start_time: float = time.time()
+    result = coordinator.crawl([url])
+    print(len(result.links))
+    print(coordinator.stats)
+    print(f"time {time.time() - start_time}")
+
+    assert len(result.links) == 40, result.links
+    assert sum(s["lost"] for s in coordinator.stats.values()) == 0
+    server.shutdown()
+
+asyncio.run(main())
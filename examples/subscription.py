@@ -11,7 +11,7 @@ class Subscription:
         print(f"{page.url} - status: {page.status_code}")
 
 async def main() -> None:
-    website: Website = Website("https://www.drake.com").with_budget({"*": 200})
+    website: Website = Website("https://www.drake.com").with_budget({"*": 200}).with_page_fields(["url", "status_code"])
     start_time: float = time.time()
     website.crawl(Subscription())
     print(f"time {time.time() - start_time}")
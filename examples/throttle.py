@@ -0,0 +1,50 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+from spider_rs import Website
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Serve linked pages and answer every third request with a 429."""
+    requests = 0
+
+    def do_GET(self) -> None:
+        ThrottlingHandler.requests += 1
+        if ThrottlingHandler.requests % 3 == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        page = int(self.path.strip("/") or 0)
+        body = "".join(f'<a href="/{page * 4 + i}">{i}</a>' for i in range(1, 5) if page * 4 + i < 40)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        self.wfile.write(f"<html><body>{body}</body></html>".encode())
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+MIN_DELAY, MAX_DELAY = 0, 5000
+
+def check_limits(limits: Dict[str, Dict[str, float]]) -> None:
+    """Assert the local host was throttled and the limits stayed within the bounds."""
+    host = limits["127.0.0.1"]
+    assert host["throttled"] > 0, host
+    assert MIN_DELAY <= host["delay"] <= MAX_DELAY, host
+    assert 1 <= host["concurrency"] <= 4, host
+
+async def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    website: Website = Website(url).with_adaptive_throttle(True, MIN_DELAY, MAX_DELAY, 4, 1000)
+    print(website.crawl_contacts([url], 10))
+    print(website.get_host_limits())
+    check_limits(website.get_host_limits())
+
+    server.shutdown()
+    print("throttle limits ok")
+
+asyncio.run(main())
@@ -11,26 +11,15 @@ class GuiacoresScraper:
         self.extracted_data: List[Dict[str, Any]] = []
 
     def extract_detail_id(self, page: Page):
-        """Extracts the detail ID from links on the search results page."""
-        if not page.get_html():
+        """Collects the detail URLs the link extractor found on the search results page."""
+        extracted = page.extracted
+        if not extracted:
             return
 
-        # Using a simple string search for demonstration, more robust parsing might be needed
-        # based on the actual HTML structure. A library like BeautifulSoup could be used here.
-        html_content = page.get_html()
-        if html_content:
-            for line in html_content.splitlines():
-                if 'span class="nombre-comercio"' in line:
-                    # This is a very basic approach, assuming the href is in the same line
-                    start = line.find('href="?r=search/detail&id=')
-                    if start != -1:
-                        start += len('href="?r=search/detail&id=')
-                        end = line.find('&', start)
-                        if end != -1:
-                            detail_id = line[start:end]
-                            detail_url = f"{self.base_url}/index.php?r=search/detail&id={detail_id}"
-                            self.detail_urls.add(detail_url)
-                            print(f"Found detail URL: {detail_url}")
+        for detail_url in extracted.get("links", []):
+            if detail_url not in self.detail_urls:
+                self.detail_urls.add(detail_url)
+                print(f"Found detail URL: {detail_url}")
 
 
     async def scrape_detail_page(self, page: Page):
@@ -97,7 +86,12 @@ class GuiacoresScraper:
             "https://www.guiacores.com.ar/index.php?r=search%2Findex&b=&R=&L=&Tm=1",
             # Setting raw_content to True might be useful for handling different encodings
             False
-        )
+        ).with_link_extractor(
+            # The detail ID is matched on the raw page bytes in Rust, only the IDs are sent back.
+            [r'span class="nombre-comercio".*?href="\?r=search/detail&id=(?P<id>[^&"]+)&'],
+            None,
+            f"{self.base_url}/index.php?r=search/detail&id={{id}}",
+        ).with_page_fields(["url", "extracted"])
 
         class SearchResultsSubscription:
             def __init__(self, scraper):
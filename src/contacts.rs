@@ -0,0 +1,483 @@
+use crate::throttle::{retry_after, url_host, AdaptiveThrottle};
+use indexmap::IndexSet;
+use pyo3::prelude::*;
+use spider::configuration::Configuration;
+use spider::lazy_static::lazy_static;
+use spider::packages::robotparser::parser::RobotFileParser;
+use std::cmp::Reverse;
+use std::collections::{BinaryHeap, HashSet};
+use std::future::Future;
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+
+/// the default amount of pages fetched per domain.
+pub const DEFAULT_MAX_PAGES: usize = 5;
+
+lazy_static! {
+  /// emails found in the page.
+  static ref EMAIL: regex::Regex =
+    regex::Regex::new(r"(?i)\b[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}\b").unwrap();
+  /// phones from tel links.
+  static ref TEL: regex::Regex = regex::Regex::new(r#"(?i)tel:([+0-9()\s.-]{6,})["']"#).unwrap();
+  /// the href of the anchors in the page.
+  static ref HREF: regex::Regex = regex::Regex::new(r#"(?i)<a\s[^>]*?href\s*=\s*["']([^"'#]*)"#).unwrap();
+  /// international phones in the text.
+  static ref PHONE: regex::Regex =
+    regex::Regex::new(r"\+\d{1,3}[\s.-]?\(?\d{1,4}\)?(?:[\s.-]?\d{2,4}){2,4}").unwrap();
+}
+
+/// the path segments most likely to hold the contacts with their score.
+const CONTACT_PATHS: [(&str, u32); 12] = [
+  ("contact", 100),
+  ("contacto", 100),
+  ("kontakt", 100),
+  ("impressum", 90),
+  ("contactanos", 90),
+  ("about", 60),
+  ("nosotros", 60),
+  ("quienes-somos", 60),
+  ("empresa", 40),
+  ("team", 30),
+  ("equipo", 30),
+  ("legal", 20),
+];
+
+/// file extensions matched by the email pattern that are not emails.
+const NOT_EMAIL: [&str; 6] = [".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp"];
+
+/// the contacts found for a domain.
+#[derive(Default, Clone)]
+#[pyclass]
+pub struct NContacts {
+  #[pyo3(get)]
+  /// The url the discovery started from.
+  pub url: String,
+  #[pyo3(get)]
+  /// The emails found.
+  pub emails: Vec<String>,
+  #[pyo3(get)]
+  /// The phones found.
+  pub phones: Vec<String>,
+  #[pyo3(get)]
+  /// The amount of pages fetched.
+  pub pages: usize,
+}
+
+/// score a link by how likely it holds the contacts.
+pub fn link_score(link: &str) -> u32 {
+  let path = match link.find("://") {
+    Some(i) => match link[i + 3..].find('/') {
+      Some(p) => &link[i + 3 + p..],
+      _ => "",
+    },
+    _ => link,
+  }
+  .to_lowercase();
+
+  CONTACT_PATHS
+    .iter()
+    .filter(|(segment, _)| path.contains(segment))
+    .map(|(_, score)| *score)
+    .max()
+    .unwrap_or_default()
+}
+
+/// extract the emails and phones from the html.
+pub fn extract_contacts(html: &str, emails: &mut IndexSet<String>, phones: &mut IndexSet<String>) {
+  for m in EMAIL.find_iter(html) {
+    let email = m.as_str().to_lowercase();
+
+    if !NOT_EMAIL.iter().any(|ext| email.ends_with(ext)) {
+      emails.insert(email);
+    }
+  }
+
+  for caps in TEL.captures_iter(html) {
+    if let Some(m) = caps.get(1) {
+      phones.insert(m.as_str().trim().to_string());
+    }
+  }
+
+  for m in PHONE.find_iter(html) {
+    phones.insert(m.as_str().trim().to_string());
+  }
+}
+
+/// the links of the html on the host of the page resolved against the page url.
+pub fn page_links(url: &str, html: &str) -> Vec<String> {
+  let base = match url::Url::parse(url) {
+    Ok(base) => base,
+    _ => return Vec::new(),
+  };
+
+  HREF
+    .captures_iter(html)
+    .filter_map(|caps| base.join(caps.get(1)?.as_str().trim()).ok())
+    .filter(|link| matches!(link.scheme(), "http" | "https") && link.host_str() == base.host_str())
+    .map(|mut link| {
+      link.set_fragment(None);
+      link.to_string()
+    })
+    .collect()
+}
+
+/// the links of a domain to fetch ordered by how likely they hold the contacts.
+struct Frontier {
+  /// the links by score then discovery order with their level.
+  queue: BinaryHeap<(u32, Reverse<usize>, usize, String)>,
+  /// the links queued.
+  visited: HashSet<String>,
+  /// the discovery order of the next link.
+  seq: usize,
+  /// the max link level followed, 0 for no limit.
+  depth: usize,
+  /// the page budget.
+  max_pages: usize,
+  /// the pages fetched.
+  pages: usize,
+}
+
+impl Frontier {
+  /// a new frontier starting from the url.
+  fn new(url: &str, depth: usize, max_pages: usize) -> Self {
+    let mut frontier = Frontier {
+      queue: BinaryHeap::new(),
+      visited: HashSet::new(),
+      seq: 0,
+      depth,
+      max_pages,
+      pages: 0,
+    };
+    frontier.visited.insert(url.to_string());
+    frontier
+      .queue
+      .push((u32::MAX, Reverse(0), 0, url.to_string()));
+    frontier
+  }
+
+  /// the next link with its level. Returns None once the budget is spent.
+  fn pop(&mut self) -> Option<(usize, String)> {
+    if self.pages >= self.max_pages {
+      return None;
+    }
+    self.queue.pop().map(|(_, _, level, link)| (level, link))
+  }
+
+  /// queue the links found on a page fetched at the level unless the depth is reached.
+  fn push_links(&mut self, level: usize, links: Vec<String>) {
+    if self.depth > 0 && level >= self.depth {
+      return;
+    }
+
+    for link in links {
+      if self.visited.insert(link.clone()) {
+        self.seq += 1;
+        self
+          .queue
+          .push((link_score(&link), Reverse(self.seq), level + 1, link));
+      }
+    }
+  }
+}
+
+/// follow the links of the url most likely to hold the contacts fetching the html with fetch. Stops once an email is found or the page budget is spent and waits the delay between pages.
+async fn discover<F, Fut>(
+  url: String,
+  depth: usize,
+  max_pages: usize,
+  delay: Duration,
+  mut fetch: F,
+) -> NContacts
+where
+  F: FnMut(String) -> Fut,
+  Fut: Future<Output = Option<String>>,
+{
+  let mut emails = IndexSet::new();
+  let mut phones = IndexSet::new();
+  let mut frontier = Frontier::new(&url, depth, max_pages);
+
+  while let Some((level, link)) = frontier.pop() {
+    if frontier.pages > 0 && !delay.is_zero() {
+      spider::tokio::time::sleep(delay).await;
+    }
+
+    // the page was not fetched or blocked by robots.txt.
+    let html = match fetch(link.clone()).await {
+      Some(html) => html,
+      _ => continue,
+    };
+    frontier.pages += 1;
+
+    extract_contacts(&html, &mut emails, &mut phones);
+
+    if !emails.is_empty() {
+      break;
+    }
+
+    frontier.push_links(level, page_links(&link, &html));
+  }
+
+  NContacts {
+    url,
+    emails: emails.into_iter().collect(),
+    phones: phones.into_iter().collect(),
+    pages: frontier.pages,
+  }
+}
+
+/// crawl the domain of the url following the links most likely to hold the contacts with the website configuration. One client is built per domain so the user agent, headers, proxies and cookies apply, and robots.txt is fetched once when respected.
+pub async fn discover_contacts(
+  url: String,
+  configuration: Arc<Configuration>,
+  max_pages: usize,
+  throttle: Option<Arc<AdaptiveThrottle>>,
+) -> NContacts {
+  let mut website = spider::website::Website::new(&url);
+  let config: &mut Configuration = &mut website.configuration;
+  *config = Configuration::clone(&configuration);
+  let client = website.configure_http_client();
+
+  let mut robots = match url::Url::parse(&url) {
+    Ok(mut origin) if configuration.respect_robots_txt => {
+      origin.set_path("/");
+      origin.set_query(None);
+      origin.set_fragment(None);
+      let mut parser = RobotFileParser::new();
+      parser.read(&client, origin.as_str()).await;
+      Some(parser)
+    }
+    _ => None,
+  };
+  let user_agent = match configuration.user_agent {
+    Some(ref ua) => ua.to_string(),
+    _ => "*".into(),
+  };
+
+  let fetch = |link: String| {
+    let allowed = match robots.as_mut() {
+      Some(robots) => robots.can_fetch(&user_agent, &link),
+      _ => true,
+    };
+    let client = client.clone();
+    let throttle = throttle.clone();
+
+    async move {
+      if !allowed {
+        return None;
+      }
+
+      let page = match throttle {
+        Some(ref throttle) => {
+          let host = url_host(&link);
+          let _permit = throttle.acquire(&host).await;
+          let start = Instant::now();
+          let page = spider::page::Page::new_page(&link, &client).await;
+          let retry = match page.headers {
+            Some(ref headers) => retry_after(headers),
+            _ => None,
+          };
+          throttle.record(
+            &host,
+            page.status_code.as_u16(),
+            Some(start.elapsed()),
+            retry,
+          );
+          page
+        }
+        _ => spider::page::Page::new_page(&link, &client).await,
+      };
+
+      if page.status_code.is_success() {
+        Some(page.get_html())
+      } else {
+        None
+      }
+    }
+  };
+
+  // the throttle spaces the requests with the delay it learned from the website delay.
+  let delay = match throttle {
+    Some(_) => Duration::ZERO,
+    _ => Duration::from_millis(configuration.delay),
+  };
+
+  discover(url.clone(), configuration.depth, max_pages, delay, fetch).await
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+  use std::collections::HashMap;
+
+  fn block_on<F: Future>(future: F) -> F::Output {
+    spider::tokio::runtime::Builder::new_current_thread()
+      .enable_time()
+      .build()
+      .unwrap()
+      .block_on(future)
+  }
+
+  #[test]
+  fn contact_paths_rank_first() {
+    assert_eq!(link_score("https://example.com/contact-us"), 100);
+    assert_eq!(link_score("https://example.com/en/Impressum"), 90);
+    assert_eq!(link_score("https://example.com/about"), 60);
+    assert_eq!(link_score("https://example.com/blog/post"), 0);
+    // the host is not scored.
+    assert_eq!(link_score("https://contact.example.com/"), 0);
+  }
+
+  #[test]
+  fn mailto_and_tel_links_are_extracted() {
+    let mut emails = IndexSet::new();
+    let mut phones = IndexSet::new();
+    extract_contacts(
+      r#"<a href="mailto:Sales@Example.com">mail</a> <a href='tel:+1 (555) 010-9999'>call</a>"#,
+      &mut emails,
+      &mut phones,
+    );
+
+    assert_eq!(
+      emails.into_iter().collect::<Vec<_>>(),
+      ["sales@example.com"]
+    );
+    assert!(phones.contains("+1 (555) 010-9999"));
+  }
+
+  #[test]
+  fn image_file_names_are_not_emails() {
+    let mut emails = IndexSet::new();
+    let mut phones = IndexSet::new();
+    extract_contacts(
+      r#"<img src="/img/logo@2x.png"><img src="icon@3x.webp"> info@example.org"#,
+      &mut emails,
+      &mut phones,
+    );
+
+    assert_eq!(emails.into_iter().collect::<Vec<_>>(), ["info@example.org"]);
+  }
+
+  #[test]
+  fn page_links_stay_on_the_host() {
+    let links = page_links(
+      "https://example.com/a/",
+      r#"<a href="contact#form">c</a> <a class="x" href='/about'>a</a> <a href="https://other.com/">o</a> <a href="mailto:x@example.com">m</a>"#,
+    );
+
+    assert_eq!(
+      links,
+      ["https://example.com/a/contact", "https://example.com/about"]
+    );
+  }
+
+  #[test]
+  fn frontier_ranks_and_respects_the_depth() {
+    let mut frontier = Frontier::new("https://example.com/", 1, 10);
+    assert_eq!(frontier.pop(), Some((0, "https://example.com/".into())));
+
+    frontier.push_links(
+      0,
+      vec![
+        "https://example.com/blog".into(),
+        "https://example.com/contact".into(),
+        "https://example.com/".into(),
+      ],
+    );
+    assert_eq!(
+      frontier.pop(),
+      Some((1, "https://example.com/contact".into()))
+    );
+
+    // links found past the depth are not queued.
+    frontier.push_links(1, vec!["https://example.com/about".into()]);
+    assert_eq!(frontier.pop(), Some((1, "https://example.com/blog".into())));
+    assert_eq!(frontier.pop(), None);
+  }
+
+  fn site() -> HashMap<String, String> {
+    HashMap::from([
+      (
+        "https://example.com/".to_string(),
+        r#"<a href="/blog">b</a><a href="/team">t</a><a href="/contact">c</a>"#.to_string(),
+      ),
+      (
+        "https://example.com/team".to_string(),
+        "call +44 20 7946 0958".to_string(),
+      ),
+      (
+        "https://example.com/contact".to_string(),
+        r#"<a href="/team">t</a>"#.to_string(),
+      ),
+      (
+        "https://example.com/blog".to_string(),
+        "hello@example.com".to_string(),
+      ),
+    ])
+  }
+
+  #[test]
+  fn discovery_stops_once_an_email_is_found() {
+    let site = site();
+    let mut fetched = Vec::new();
+    let contacts = block_on(discover(
+      "https://example.com/".into(),
+      0,
+      10,
+      Duration::ZERO,
+      |link: String| {
+        fetched.push(link.clone());
+        let html = site.get(&link).cloned();
+        async move { html }
+      },
+    ));
+
+    assert_eq!(
+      fetched,
+      [
+        "https://example.com/",
+        "https://example.com/contact",
+        "https://example.com/team",
+        "https://example.com/blog"
+      ]
+    );
+    assert_eq!(contacts.emails, ["hello@example.com"]);
+    assert_eq!(contacts.phones, ["+44 20 7946 0958"]);
+    assert_eq!(contacts.pages, 4);
+  }
+
+  #[test]
+  fn discovery_spends_only_the_page_budget() {
+    let site = site();
+    let contacts = block_on(discover(
+      "https://example.com/".into(),
+      0,
+      2,
+      Duration::ZERO,
+      |link: String| {
+        let html = site.get(&link).cloned();
+        async move { html }
+      },
+    ));
+
+    assert_eq!(contacts.pages, 2);
+    assert!(contacts.emails.is_empty());
+
+    // pages that were not fetched do not count against the budget.
+    let contacts = block_on(discover(
+      "https://example.com/".into(),
+      0,
+      2,
+      Duration::ZERO,
+      |link: String| {
+        let html = site
+          .get(&link)
+          .filter(|_| !link.ends_with("/contact"))
+          .cloned();
+        async move { html }
+      },
+    ));
+
+    assert_eq!(contacts.pages, 2);
+    assert_eq!(contacts.phones, ["+44 20 7946 0958"]);
+  }
+}
@@ -0,0 +1,775 @@
+use crate::link_extractor::{LinkExtractor, LinkExtractorSpec};
+use crate::npage::PageFields;
+use crate::visited::{validate_fp_rate, ScalableBloom, Visited, DEFAULT_CAPACITY, DEFAULT_FP_RATE};
+use crate::website::forward_pages;
+use crate::{new_page, NPage, NWebsite, PageOptions, Website, BUFFER};
+use pyo3::exceptions::{PyIOError, PyValueError};
+use pyo3::prelude::*;
+use serde::{Deserialize, Serialize};
+use spider::configuration::Configuration;
+use spider::tokio;
+use spider::tokio::io::{AsyncBufReadExt, AsyncWriteExt, BufReader, Lines};
+use spider::tokio::net::tcp::OwnedReadHalf;
+use spider::tokio::net::{TcpListener, TcpStream};
+use spider::tokio::sync::{mpsc, Semaphore};
+use std::collections::hash_map::{DefaultHasher, RandomState};
+use std::collections::{HashMap, HashSet};
+use std::hash::{BuildHasher, Hash, Hasher};
+use std::path::Path;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::Arc;
+use std::time::Duration;
+
+/// the max time to wait for the workers to connect.
+const CONNECT_TIMEOUT: Duration = Duration::from_secs(60);
+/// the max time to wait for a connection to send the handshake.
+const HANDSHAKE_TIMEOUT: Duration = Duration::from_secs(10);
+/// the environment variable holding the shared secret of the workers.
+pub const TOKEN_ENV: &str = "SPIDER_RS_COORDINATOR_TOKEN";
+
+/// the crawl job sent to every worker.
+#[derive(Serialize, Deserialize, Clone)]
+pub struct JobSpec {
+  /// the website configuration.
+  pub configuration: Configuration,
+  /// do not convert content to UTF-8.
+  pub raw: bool,
+  /// the link extractor compiled on every worker.
+  #[serde(default)]
+  pub link_extractor: Option<LinkExtractorSpec>,
+  /// the page fields to materialize.
+  pub fields: Option<PageFields>,
+  /// crawl with chrome.
+  pub headless: bool,
+  /// the amount of urls a worker crawls at once.
+  pub concurrency: usize,
+}
+
+/// the messages exchanged between the coordinator and the workers as JSON lines.
+#[derive(Serialize, Deserialize)]
+#[serde(tag = "type", rename_all = "snake_case")]
+enum Message {
+  /// the worker handshake with the shared secret.
+  Hello { token: String },
+  /// the job for the worker.
+  Job { shard: usize, spec: JobSpec },
+  /// crawl a url or only fetch the page at the link depth when sharding by url.
+  Crawl {
+    url: String,
+    #[serde(default)]
+    page_only: bool,
+    #[serde(default)]
+    depth: usize,
+  },
+  /// stop the worker.
+  Shutdown,
+  /// a page found by a worker.
+  Page { page: NPage },
+  /// the links found on a page fetched when sharding by url.
+  Links { depth: usize, links: Vec<String> },
+  /// a url crawl completed.
+  Finished { url: String, pages: usize },
+  /// the worker connection closed.
+  Closed,
+}
+
+/// encode a message as a line.
+fn encode(message: &Message) -> Vec<u8> {
+  let mut line = serde_json::to_vec(message).unwrap_or_default();
+  line.push(b'\n');
+  line
+}
+
+/// a new random shared secret for the workers.
+fn new_token() -> String {
+  format!(
+    "{:016x}{:016x}",
+    RandomState::new().hash_one(0u8),
+    RandomState::new().hash_one(1u8)
+  )
+}
+
+/// compare the tokens in constant time.
+fn token_eq(a: &str, b: &str) -> bool {
+  a.len() == b.len()
+    && a
+      .bytes()
+      .zip(b.bytes())
+      .fold(0, |acc, (x, y)| acc | (x ^ y))
+      == 0
+}
+
+/// read the handshake of a new connection. Returns true if it sent the shared secret.
+async fn handshake(lines: &mut Lines<BufReader<OwnedReadHalf>>, token: &str) -> bool {
+  match tokio::time::timeout(HANDSHAKE_TIMEOUT, lines.next_line()).await {
+    Ok(Ok(Some(line))) => matches!(
+      serde_json::from_str::<Message>(&line),
+      Ok(Message::Hello { token: t }) if token_eq(&t, token)
+    ),
+    _ => false,
+  }
+}
+
+/// the frontier key of the url used for sharding.
+fn shard_key(url: &str, by_host: bool) -> String {
+  if by_host {
+    match url::Url::parse(url) {
+      Ok(u) => u.host_str().unwrap_or_default().to_string(),
+      _ => url.to_string(),
+    }
+  } else {
+    url.to_string()
+  }
+}
+
+/// the shard owning the key.
+fn shard_of(key: &str, shards: usize) -> usize {
+  let mut hasher = DefaultHasher::new();
+  key.hash(&mut hasher);
+  (hasher.finish() % shards as u64) as usize
+}
+
+/// stats of a worker.
+#[derive(Default, Clone)]
+struct WorkerStats {
+  /// the urls assigned.
+  assigned: usize,
+  /// the urls completed.
+  finished: usize,
+  /// the pages found.
+  pages: usize,
+  /// the urls lost when the worker disconnected.
+  lost: usize,
+}
+
+/// a coordinator sharding a crawl across worker processes.
+#[pyclass]
+pub struct Coordinator {
+  /// the job sent to every worker.
+  spec: JobSpec,
+  /// the amount of workers.
+  workers: usize,
+  /// the address to listen on for workers.
+  address: String,
+  /// spawn the workers as local subprocesses.
+  spawn: bool,
+  /// the shared secret the workers send before receiving the job.
+  token: String,
+  /// shard the frontier by host instead of url.
+  by_host: bool,
+  /// crawl the new hosts found by the workers.
+  follow_hosts: bool,
+  /// the stats of the last run by shard.
+  stats: Vec<WorkerStats>,
+  /// keep the visited urls in a bloom filter with the false positive rate, capacity and file path.
+  visited_filter: Option<(f64, usize, Option<String>)>,
+  /// the count, bytes and false positive rate of the visited urls of the last run.
+  visited_stats: (usize, usize, f64),
+}
+
+impl Coordinator {
+  /// run the crawl merging the pages found by the workers.
+  async fn run(
+    &mut self,
+    urls: Vec<String>,
+    python: String,
+    on_page_event: Option<PyObject>,
+  ) -> std::io::Result<NWebsite> {
+    let listener = TcpListener::bind(&self.address).await?;
+    let address = listener.local_addr()?.to_string();
+    let mut children = Vec::new();
+
+    if self.spawn {
+      for _ in 0..self.workers {
+        children.push(
+          tokio::process::Command::new(&python)
+            .arg("-c")
+            .arg(format!(
+              "import spider_rs; spider_rs.run_worker({:?})",
+              address
+            ))
+            .env(TOKEN_ENV, &self.token)
+            .kill_on_drop(true)
+            .spawn()?,
+        );
+      }
+    }
+
+    let (tx, mut rx) = mpsc::unbounded_channel::<(usize, Message)>();
+    let mut writers = Vec::with_capacity(self.workers);
+
+    let deadline = tokio::time::Instant::now() + CONNECT_TIMEOUT;
+
+    while writers.len() < self.workers {
+      let (stream, _) = match tokio::time::timeout_at(deadline, listener.accept()).await {
+        Ok(s) => s?,
+        _ => {
+          return Err(std::io::Error::new(
+            std::io::ErrorKind::TimedOut,
+            "workers did not connect",
+          ))
+        }
+      };
+      let (read, mut write) = stream.into_split();
+      let mut lines = BufReader::new(read).lines();
+
+      // connections without the shared secret never receive the job.
+      if !handshake(&mut lines, &self.token).await {
+        continue;
+      }
+
+      let shard = writers.len();
+      write
+        .write_all(&encode(&Message::Job {
+          shard,
+          spec: self.spec.clone(),
+        }))
+        .await?;
+      writers.push(write);
+
+      let tx = tx.clone();
+
+      tokio::spawn(async move {
+        while let Ok(Some(line)) = lines.next_line().await {
+          if let Ok(message) = serde_json::from_str::<Message>(&line) {
+            let _ = tx.send((shard, message));
+          }
+        }
+
+        let _ = tx.send((shard, Message::Closed));
+      });
+    }
+
+    drop(tx);
+
+    self.stats = vec![WorkerStats::default(); self.workers];
+
+    let mut seen = match &self.visited_filter {
+      Some((fp_rate, capacity, path)) => Visited::Bloom(match path {
+        Some(p) if Path::new(p).exists() => ScalableBloom::load(Path::new(p))?,
+        _ => ScalableBloom::new(*fp_rate, *capacity),
+      }),
+      _ => Visited::Exact(HashSet::new()),
+    };
+    let mut closed = vec![false; self.workers];
+    let mut pending = 0;
+    let mut links = Vec::new();
+    let mut pages = Vec::new();
+
+    let page_only = !self.by_host;
+    let max_depth = self.spec.configuration.depth;
+    // the hosts of the urls passed in and the hosts crawled kept exactly.
+    let mut hosts = HashSet::new();
+    // the urls passed in are crawled even if a filter from a previous run has seen them.
+    let mut seeds = HashSet::new();
+
+    for url in urls {
+      let host = shard_key(&url, true);
+      let new_host = hosts.insert(host.clone());
+
+      if !seeds.insert(url.clone()) || (self.by_host && !new_host) {
+        continue;
+      }
+
+      seen.insert(&url);
+
+      let key = if self.by_host { host } else { url.clone() };
+      let shard = shard_of(&key, self.workers);
+      writers[shard]
+        .write_all(&encode(&Message::Crawl {
+          url,
+          page_only,
+          depth: 0,
+        }))
+        .await?;
+      self.stats[shard].assigned += 1;
+      pending += 1;
+    }
+
+    while pending > 0 {
+      let (shard, message) = match rx.recv().await {
+        Some(m) => m,
+        _ => break,
+      };
+
+      // the links to send to the worker owning the key.
+      let mut next = Vec::new();
+
+      match message {
+        Message::Page { page } => {
+          self.stats[shard].pages += 1;
+
+          if self.follow_hosts && self.by_host {
+            if let Some(page_links) = &page.links {
+              for link in page_links {
+                let key = shard_key(link, true);
+
+                if !key.is_empty() && hosts.insert(key.clone()) {
+                  next.push((key, link.clone(), 0));
+                }
+              }
+            }
+          }
+
+          seen.insert(&page.url);
+
+          // the filter replaces the list of links so only the pages or page events hold the urls.
+          if self.visited_filter.is_none() {
+            links.push(page.url.clone());
+          }
+
+          match &on_page_event {
+            Some(callback) => Python::with_gil(|py| {
+              let _ = callback.call(py, (page,), None);
+            }),
+            _ => pages.push(page),
+          }
+        }
+        Message::Links {
+          depth,
+          links: page_links,
+        } if max_depth == 0 || depth < max_depth => {
+          for link in page_links {
+            let host = shard_key(&link, true);
+
+            if !host.is_empty()
+              && (self.follow_hosts || hosts.contains(&host))
+              && seen.insert(&link)
+            {
+              next.push((link.clone(), link, depth + 1));
+            }
+          }
+        }
+        Message::Finished { .. } => {
+          self.stats[shard].finished += 1;
+          pending -= 1;
+        }
+        Message::Closed => {
+          closed[shard] = true;
+          let stats = &mut self.stats[shard];
+          stats.lost = stats.assigned - stats.finished;
+          pending -= stats.lost;
+        }
+        _ => (),
+      }
+
+      for (key, url, depth) in next {
+        let owner = shard_of(&key, self.workers);
+
+        if !closed[owner]
+          && writers[owner]
+            .write_all(&encode(&Message::Crawl {
+              url,
+              page_only,
+              depth,
+            }))
+            .await
+            .is_ok()
+        {
+          self.stats[owner].assigned += 1;
+          pending += 1;
+        }
+      }
+    }
+
+    for write in writers.iter_mut() {
+      let _ = write.write_all(&encode(&Message::Shutdown)).await;
+    }
+
+    for mut child in children {
+      let _ = child.wait().await;
+    }
+
+    self.visited_stats = (seen.len(), seen.memory_usage(), seen.fp_rate());
+
+    if let (Visited::Bloom(filter), Some((_, _, Some(path)))) = (&seen, &self.visited_filter) {
+      filter.save(Path::new(path))?;
+    }
+
+    Ok(NWebsite { links, pages })
+  }
+}
+
+#[pymethods]
+impl Coordinator {
+  /// a new coordinator sending the website configuration and link extractor to every worker. Raises a ValueError if the website uses the adaptive throttle.
+  #[new]
+  #[pyo3(signature = (website, workers=None, headless=None, concurrency=None))]
+  pub fn new(
+    website: PyRef<'_, Website>,
+    workers: Option<usize>,
+    headless: Option<bool>,
+    concurrency: Option<usize>,
+  ) -> PyResult<Self> {
+    Ok(Coordinator {
+      spec: website.job_spec(headless.unwrap_or_default(), concurrency.unwrap_or(4))?,
+      workers: workers.unwrap_or_else(num_cpus::get).max(1),
+      address: "127.0.0.1:0".into(),
+      spawn: true,
+      token: new_token(),
+      by_host: true,
+      follow_hosts: false,
+      stats: Vec::new(),
+      visited_filter: None,
+      visited_stats: Default::default(),
+    })
+  }
+
+  /// Listen for workers on the address. Use `0.0.0.0:<port>` with spawn set to false to let workers on other machines connect. Workers must send the token before receiving the job, a random token is used if not set. The connection is plaintext and the job holds the website headers, cookies and proxies, only listen on trusted networks.
+  #[pyo3(signature = (address, spawn=None, token=None))]
+  pub fn with_address(
+    mut slf: PyRefMut<'_, Self>,
+    address: String,
+    spawn: Option<bool>,
+    token: Option<String>,
+  ) -> PyRefMut<'_, Self> {
+    slf.address = address;
+    slf.spawn = spawn.unwrap_or(true);
+    if let Some(token) = token {
+      slf.token = token;
+    }
+    slf
+  }
+
+  /// get the shared secret the workers send to the coordinator.
+  #[getter]
+  pub fn token(&self) -> String {
+    self.token.clone()
+  }
+
+  /// Shard the frontier by `host` or `url`. Sharding by host crawls the whole site of every url on the worker owning the host. Sharding by url only fetches the page on the worker owning the url and the links found on the same hosts as the urls passed in are sharded across the workers up to the website depth.
+  pub fn with_shard_by(mut slf: PyRefMut<'_, Self>, shard_by: String) -> PyRefMut<'_, Self> {
+    slf.by_host = shard_by != "url";
+    slf
+  }
+
+  /// Crawl the new hosts found in the page links. When sharding by host the hosts are crawled on the worker owning the host and require with_return_page_links and external domains on the website. When sharding by url the links of every host are followed.
+  pub fn with_follow_hosts(mut slf: PyRefMut<'_, Self>, follow_hosts: bool) -> PyRefMut<'_, Self> {
+    slf.follow_hosts = follow_hosts;
+    slf
+  }
+
+  /// Keep the frontier of the urls visited in a scalable bloom filter with the false positive rate instead of storing every url. Requires sharding by url. The links of the crawl result are not kept, read the urls from the pages or the page events. The urls passed to crawl are always crawled. The filter is loaded from and saved to the path between runs. Raises a ValueError if the false positive rate is not in (0, 0.5].
+  #[pyo3(signature = (fp_rate=None, capacity=None, path=None))]
+  pub fn with_visited_filter(
+    mut slf: PyRefMut<'_, Self>,
+    fp_rate: Option<f64>,
+    capacity: Option<usize>,
+    path: Option<String>,
+  ) -> PyResult<PyRefMut<'_, Self>> {
+    let fp_rate =
+      validate_fp_rate(fp_rate.unwrap_or(DEFAULT_FP_RATE)).map_err(PyValueError::new_err)?;
+    slf.visited_filter = Some((fp_rate, capacity.unwrap_or(DEFAULT_CAPACITY), path));
+    Ok(slf)
+  }
+
+  /// crawl the urls across the workers returning the merged links and pages. The pages are not stored when on_page_event is set. Raises a ValueError if the visited filter is set when sharding by host.
+  #[pyo3(signature = (urls, on_page_event=None))]
+  pub fn crawl(
+    mut slf: PyRefMut<'_, Self>,
+    urls: Vec<String>,
+    on_page_event: Option<PyObject>,
+  ) -> PyResult<NWebsite> {
+    if slf.by_host && slf.visited_filter.is_some() {
+      return Err(PyValueError::new_err(
+        "the visited filter requires sharding by url",
+      ));
+    }
+
+    let py = slf.py();
+    let python: String = py.import("sys")?.getattr("executable")?.extract()?;
+    let coordinator: &mut Coordinator = &mut slf;
+
+    py.allow_threads(|| {
+      pyo3_async_runtimes::tokio::get_runtime()
+        .block_on(coordinator.run(urls, python, on_page_event))
+        .map_err(|e| PyIOError::new_err(e.to_string()))
+    })
+  }
+
+  /// get the count, memory usage in bytes and estimated false positive rate of the visited urls of the last crawl.
+  #[getter]
+  pub fn visited_stats(&self) -> HashMap<String, f64> {
+    let (count, memory_usage, fp_rate) = self.visited_stats;
+
+    HashMap::from([
+      ("count".to_string(), count as f64),
+      ("memory_usage".to_string(), memory_usage as f64),
+      ("fp_rate".to_string(), fp_rate),
+    ])
+  }
+
+  /// get the stats of the last crawl by worker shard.
+  #[getter]
+  pub fn stats(&self) -> HashMap<usize, HashMap<String, usize>> {
+    self
+      .stats
+      .iter()
+      .enumerate()
+      .map(|(shard, s)| {
+        (
+          shard,
+          HashMap::from([
+            ("assigned".to_string(), s.assigned),
+            ("finished".to_string(), s.finished),
+            ("pages".to_string(), s.pages),
+            ("lost".to_string(), s.lost),
+          ]),
+        )
+      })
+      .collect()
+  }
+}
+
+/// the finished message for a url sent when dropped so a crawl that panicked or was cancelled still completes at the coordinator.
+struct FinishGuard {
+  /// the url crawled.
+  url: String,
+  /// the amount of pages found.
+  pages: AtomicUsize,
+  /// the messages sent to the coordinator.
+  out: mpsc::UnboundedSender<Vec<u8>>,
+}
+
+impl Drop for FinishGuard {
+  fn drop(&mut self) {
+    let _ = self.out.send(encode(&Message::Finished {
+      url: std::mem::take(&mut self.url),
+      pages: *self.pages.get_mut(),
+    }));
+  }
+}
+
+/// crawl a url sending the pages found to the coordinator. Only the page is fetched with page_only and its links are sent back to be sharded.
+async fn crawl_url(
+  spec: Arc<JobSpec>,
+  options: Arc<PageOptions>,
+  page_only: bool,
+  depth: usize,
+  guard: &FinishGuard,
+) {
+  let mut website = spider::website::Website::new(&guard.url);
+  let configuration: &mut Configuration = &mut website.configuration;
+  *configuration = spec.configuration.clone();
+
+  if page_only {
+    website.with_budget(Some([("*", 1)].into_iter().collect()));
+    website.with_return_page_links(true);
+  }
+
+  let mut rx2 = website
+    .subscribe(*BUFFER / 2)
+    .expect("sync feature should be enabled");
+
+  let crawl = async {
+    if spec.headless {
+      website.crawl().await;
+    } else {
+      website.crawl_raw().await;
+    }
+  };
+  let on_page = |res: &spider::page::Page| {
+    guard.pages.fetch_add(1, Ordering::Relaxed);
+    let _ = guard.out.send(encode(&Message::Page {
+      page: new_page(res, &options),
+    }));
+
+    if page_only {
+      if let Some(ref links) = res.page_links {
+        let _ = guard.out.send(encode(&Message::Links {
+          depth,
+          links: links.iter().map(|l| l.as_ref().to_string()).collect(),
+        }));
+      }
+    }
+  };
+
+  forward_pages(&mut rx2, crawl, on_page).await;
+}
+
+/// run a worker connecting to the coordinator at the address with the shared secret until it is shutdown.
+pub async fn run_worker(address: String, token: String) -> std::io::Result<()> {
+  let stream = TcpStream::connect(&address).await?;
+  let (read, mut write) = stream.into_split();
+  let mut lines = BufReader::new(read).lines();
+
+  write.write_all(&encode(&Message::Hello { token })).await?;
+
+  let spec = match lines.next_line().await? {
+    Some(line) => match serde_json::from_str::<Message>(&line) {
+      Ok(Message::Job { spec, .. }) => Arc::new(spec),
+      _ => {
+        return Err(std::io::Error::new(
+          std::io::ErrorKind::InvalidData,
+          "expected a job from the coordinator",
+        ))
+      }
+    },
+    _ => {
+      return Err(std::io::Error::new(
+        std::io::ErrorKind::PermissionDenied,
+        "the coordinator closed the connection, check the token",
+      ))
+    }
+  };
+
+  let link_extractor = match &spec.link_extractor {
+    Some(extractor) => Some(Arc::new(
+      LinkExtractor::from_spec(extractor)
+        .map_err(|e| std::io::Error::new(std::io::ErrorKind::InvalidData, e))?,
+    )),
+    _ => None,
+  };
+  let options = Arc::new(PageOptions {
+    raw: spec.raw,
+    link_extractor,
+    fields: spec.fields.clone().map(Arc::new),
+    ..Default::default()
+  });
+
+  let (out, mut out_rx) = mpsc::unbounded_channel::<Vec<u8>>();
+
+  let writer = tokio::spawn(async move {
+    while let Some(line) = out_rx.recv().await {
+      if write.write_all(&line).await.is_err() {
+        break;
+      }
+    }
+  });
+
+  let semaphore = Arc::new(Semaphore::new(spec.concurrency.max(1)));
+  let mut tasks = tokio::task::JoinSet::new();
+
+  while let Some(line) = lines.next_line().await? {
+    match serde_json::from_str::<Message>(&line) {
+      Ok(Message::Crawl {
+        url,
+        page_only,
+        depth,
+      }) => {
+        let spec = spec.clone();
+        let options = options.clone();
+        let guard = FinishGuard {
+          url,
+          pages: AtomicUsize::new(0),
+          out: out.clone(),
+        };
+        let semaphore = semaphore.clone();
+
+        tasks.spawn(async move {
+          if let Ok(_permit) = semaphore.acquire_owned().await {
+            crawl_url(spec, options, page_only, depth, &guard).await;
+          }
+        });
+      }
+      Ok(Message::Shutdown) => break,
+      _ => (),
+    }
+  }
+
+  tasks.abort_all();
+  drop(out);
+  writer.abort();
+
+  Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  #[test]
+  fn shard_of_is_stable_and_in_range() {
+    for shards in 1..8 {
+      for i in 0..100 {
+        let key = format!("https://example.com/{}", i);
+        let shard = shard_of(&key, shards);
+        assert!(shard < shards);
+        assert_eq!(shard, shard_of(&key, shards));
+      }
+    }
+
+    let used: HashSet<usize> = (0..100)
+      .map(|i| shard_of(&format!("https://example.com/{}", i), 4))
+      .collect();
+    assert_eq!(used.len(), 4);
+  }
+
+  #[test]
+  fn shard_key_uses_the_host() {
+    assert_eq!(shard_key("https://example.com/a?b=1", true), "example.com");
+    assert_eq!(
+      shard_key("https://example.com/a?b=1", false),
+      "https://example.com/a?b=1"
+    );
+    assert_eq!(shard_key("not a url", true), "not a url");
+  }
+
+  fn round_trip(message: &Message) -> Message {
+    let line = encode(message);
+    assert_eq!(line.last(), Some(&b'\n'));
+    serde_json::from_slice(&line).unwrap()
+  }
+
+  #[test]
+  fn messages_round_trip() {
+    assert!(matches!(
+      round_trip(&Message::Hello { token: "secret".into() }),
+      Message::Hello { token } if token == "secret"
+    ));
+    assert!(matches!(
+      round_trip(&Message::Crawl { url: "https://example.com".into(), page_only: true, depth: 2 }),
+      Message::Crawl { url, page_only: true, depth: 2 } if url == "https://example.com"
+    ));
+    assert!(matches!(
+      round_trip(&Message::Links { depth: 1, links: vec!["https://example.com/a".into()] }),
+      Message::Links { depth: 1, links } if links == ["https://example.com/a"]
+    ));
+    assert!(matches!(
+      round_trip(&Message::Finished { url: "https://example.com".into(), pages: 3 }),
+      Message::Finished { url, pages: 3 } if url == "https://example.com"
+    ));
+    assert!(matches!(round_trip(&Message::Shutdown), Message::Shutdown));
+    assert!(matches!(
+      serde_json::from_str::<Message>(r#"{"type":"crawl","url":"https://example.com"}"#),
+      Ok(Message::Crawl {
+        page_only: false,
+        depth: 0,
+        ..
+      })
+    ));
+
+    let spec = JobSpec {
+      configuration: Configuration::default(),
+      raw: true,
+      link_extractor: Some(LinkExtractorSpec {
+        patterns: vec![r"id=(?P<id>\d+)".into()],
+        pages: None,
+        template: Some("https://example.com/{id}".into()),
+      }),
+      fields: None,
+      headless: false,
+      concurrency: 2,
+    };
+
+    match round_trip(&Message::Job { shard: 1, spec }) {
+      Message::Job { shard, spec } => {
+        assert_eq!(shard, 1);
+        assert!(spec.raw);
+        assert_eq!(spec.concurrency, 2);
+        assert!(LinkExtractor::from_spec(&spec.link_extractor.unwrap()).is_ok());
+      }
+      _ => panic!("expected a job"),
+    }
+  }
+
+  #[test]
+  fn tokens_are_random_and_compared_exactly() {
+    let token = new_token();
+    assert_eq!(token.len(), 32);
+    assert_ne!(token, new_token());
+    assert!(token_eq(&token, &token.clone()));
+    assert!(!token_eq(&token, &new_token()));
+    assert!(!token_eq(&token, &token[..31]));
+  }
+}
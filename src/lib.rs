@@ -1,5 +1,6 @@
 #![deny(clippy::all)]
 
+use pyo3::exceptions::{PyIOError, PyValueError};
 use pyo3::prelude::*;
 use spider::lazy_static::lazy_static;
 
@@ -7,17 +8,27 @@ lazy_static! {
   pub static ref BUFFER: usize = (num_cpus::get() * 20).max(88);
 }
 
+pub mod contacts;
+pub mod coordinator;
+pub mod link_extractor;
 pub mod npage;
 pub mod nwebsite;
 pub mod page;
+pub mod page_store;
 pub mod shortcut;
+pub mod throttle;
 pub mod utils;
+pub mod visited;
 pub mod website;
 
-pub use npage::{new_page, page_title, NPage};
+pub use contacts::NContacts;
+pub use coordinator::Coordinator;
+pub use npage::{new_page, page_title, NPage, PageOptions};
 pub use nwebsite::NWebsite;
 pub use page::Page;
+pub use page_store::PageSequence;
 pub use utils::pydict_to_json_value;
+pub use visited::VisitedFilter;
 pub use website::Website;
 
 #[pyfunction]
@@ -31,11 +42,37 @@ fn crawl(py: Python, url: String, raw_content: Option<bool>) -> PyResult<Bound<P
   })
 }
 
+#[pyfunction]
+#[pyo3(signature = (address, token=None))]
+/// Run a crawl worker for the coordinator listening on the address until it is shutdown. The token is the shared secret of the coordinator and defaults to the `SPIDER_RS_COORDINATOR_TOKEN` environment variable.
+fn run_worker(py: Python, address: String, token: Option<String>) -> PyResult<()> {
+  let token = match token.or_else(|| std::env::var(coordinator::TOKEN_ENV).ok()) {
+    Some(token) => token,
+    _ => {
+      return Err(PyValueError::new_err(format!(
+        "the coordinator token is required, pass it or set {}",
+        coordinator::TOKEN_ENV
+      )))
+    }
+  };
+
+  py.allow_threads(|| {
+    pyo3_async_runtimes::tokio::get_runtime()
+      .block_on(coordinator::run_worker(address, token))
+      .map_err(|e| PyIOError::new_err(e.to_string()))
+  })
+}
+
 #[pymodule]
 fn spider_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
   m.add_function(wrap_pyfunction!(crawl, m)?)?;
+  m.add_function(wrap_pyfunction!(run_worker, m)?)?;
   m.add_class::<Website>()?;
   m.add_class::<Page>()?;
+  m.add_class::<PageSequence>()?;
+  m.add_class::<Coordinator>()?;
+  m.add_class::<NContacts>()?;
+  m.add_class::<VisitedFilter>()?;
 
   Ok(())
 }
@@ -0,0 +1,305 @@
+use globset::{Glob, GlobSet, GlobSetBuilder};
+use indexmap::{IndexMap, IndexSet};
+use regex::bytes::{Regex, RegexSet};
+use serde::{Deserialize, Serialize};
+use std::collections::HashMap;
+
+/// the key used for matches of patterns without named groups.
+pub const MATCH_KEY: &str = "match";
+/// the key used for the links built from the url template.
+pub const LINKS_KEY: &str = "links";
+
+/// the patterns, page globs and url template a link extractor is compiled from.
+#[derive(Debug, Default, Clone, Serialize, Deserialize)]
+pub struct LinkExtractorSpec {
+  /// the regex patterns.
+  pub patterns: Vec<String>,
+  /// the page url globs.
+  pub pages: Option<Vec<String>>,
+  /// the url template.
+  pub template: Option<String>,
+}
+
+/// extract ids and links from the raw page bytes with compiled pattern sets.
+#[derive(Debug)]
+pub struct LinkExtractor {
+  /// the spec the extractor was compiled from.
+  spec: LinkExtractorSpec,
+  /// all of the patterns checked in one pass.
+  set: RegexSet,
+  /// the patterns used to capture the values of the matched set entries.
+  patterns: Vec<Regex>,
+  /// the named groups of each pattern.
+  names: Vec<Vec<String>>,
+  /// only run the extraction on page urls matching the globs.
+  pages: Option<GlobSet>,
+  /// build links from the named groups replacing `{name}` in the template.
+  template: Option<String>,
+  /// the `{name}` placeholders of the template.
+  placeholders: Vec<String>,
+}
+
+impl LinkExtractor {
+  /// compile a new link extractor.
+  pub fn new(
+    patterns: &[String],
+    pages: Option<&[String]>,
+    template: Option<String>,
+  ) -> Result<Self, String> {
+    let spec = LinkExtractorSpec {
+      patterns: patterns.to_vec(),
+      pages: pages.map(|globs| globs.to_vec()),
+      template: template.clone(),
+    };
+    let set = RegexSet::new(patterns).map_err(|e| e.to_string())?;
+    let mut compiled = Vec::with_capacity(patterns.len());
+    let mut names = Vec::with_capacity(patterns.len());
+
+    for pattern in patterns {
+      let re = Regex::new(pattern).map_err(|e| e.to_string())?;
+      names.push(
+        re.capture_names()
+          .flatten()
+          .map(|name| name.to_string())
+          .collect(),
+      );
+      compiled.push(re);
+    }
+
+    let pages = match pages {
+      Some(globs) => {
+        let mut builder = GlobSetBuilder::new();
+        for glob in globs {
+          builder.add(Glob::new(glob).map_err(|e| e.to_string())?);
+        }
+        Some(builder.build().map_err(|e| e.to_string())?)
+      }
+      _ => None,
+    };
+
+    let placeholders = template.as_deref().map(placeholders).unwrap_or_default();
+
+    Ok(LinkExtractor {
+      spec,
+      set,
+      patterns: compiled,
+      names,
+      pages,
+      template,
+      placeholders,
+    })
+  }
+
+  /// compile a link extractor from the spec.
+  pub fn from_spec(spec: &LinkExtractorSpec) -> Result<Self, String> {
+    Self::new(&spec.patterns, spec.pages.as_deref(), spec.template.clone())
+  }
+
+  /// the spec the extractor was compiled from.
+  pub fn spec(&self) -> &LinkExtractorSpec {
+    &self.spec
+  }
+
+  /// extract the values of the named groups from the page. Returns None if the page is skipped or nothing matched.
+  pub fn extract(&self, url: &str, html: &[u8]) -> Option<HashMap<String, Vec<String>>> {
+    if let Some(pages) = &self.pages {
+      if !pages.is_match(url) {
+        return None;
+      }
+    }
+
+    let matched = self.set.matches(html);
+
+    if !matched.matched_any() {
+      return None;
+    }
+
+    let mut values: IndexMap<String, IndexSet<String>> = IndexMap::new();
+
+    for i in matched.iter() {
+      let names = &self.names[i];
+
+      for caps in self.patterns[i].captures_iter(html) {
+        if names.is_empty() {
+          if let Some(m) = caps.get(0) {
+            values
+              .entry(MATCH_KEY.into())
+              .or_default()
+              .insert(String::from_utf8_lossy(m.as_bytes()).into_owned());
+          }
+          continue;
+        }
+
+        for name in names {
+          if let Some(m) = caps.name(name) {
+            values
+              .entry(name.clone())
+              .or_default()
+              .insert(String::from_utf8_lossy(m.as_bytes()).into_owned());
+          }
+        }
+
+        if let Some(link) = self.build_link(&caps) {
+          values.entry(LINKS_KEY.into()).or_default().insert(link);
+        }
+      }
+    }
+
+    Some(
+      values
+        .into_iter()
+        .map(|(k, v)| (k, v.into_iter().collect()))
+        .collect(),
+    )
+  }
+
+  /// build the link from the template. Returns None unless every placeholder was captured.
+  fn build_link(&self, caps: &regex::bytes::Captures) -> Option<String> {
+    let mut link = self.template.clone()?;
+
+    for name in &self.placeholders {
+      let value = caps.name(name)?;
+      link = link.replace(
+        &format!("{{{}}}", name),
+        &String::from_utf8_lossy(value.as_bytes()),
+      );
+    }
+
+    Some(link)
+  }
+}
+
+/// the unique `{name}` placeholders of the template.
+fn placeholders(template: &str) -> Vec<String> {
+  let mut names = IndexSet::new();
+  let mut rest = template;
+
+  while let Some(start) = rest.find('{') {
+    rest = &rest[start + 1..];
+    match rest.find('}') {
+      Some(end) => {
+        let name = &rest[..end];
+        if !name.is_empty() && name.chars().all(|c| c.is_alphanumeric() || c == '_') {
+          names.insert(name.to_string());
+        }
+        rest = &rest[end + 1..];
+      }
+      _ => break,
+    }
+  }
+
+  names.into_iter().collect()
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  fn extractor(patterns: &[&str], pages: Option<&[&str]>, template: Option<&str>) -> LinkExtractor {
+    let patterns: Vec<String> = patterns.iter().map(|p| p.to_string()).collect();
+    let pages: Option<Vec<String>> = pages.map(|g| g.iter().map(|p| p.to_string()).collect());
+    LinkExtractor::new(&patterns, pages.as_deref(), template.map(String::from)).unwrap()
+  }
+
+  #[test]
+  fn template_substitutes_named_groups() {
+    let extractor = extractor(
+      &[r#"id=(?P<id>\d+)&cat=(?P<cat>\w+)"#],
+      None,
+      Some("https://example.com/{cat}/{id}"),
+    );
+    let values = extractor
+      .extract("https://example.com/", b"<a href=\"?id=7&cat=food\">")
+      .unwrap();
+
+    assert_eq!(values["id"], vec!["7"]);
+    assert_eq!(values["cat"], vec!["food"]);
+    assert_eq!(values[LINKS_KEY], vec!["https://example.com/food/7"]);
+  }
+
+  #[test]
+  fn template_skips_links_with_unfilled_placeholders() {
+    let extractor = extractor(
+      &[r#"id=(?P<id>\d+)(&cat=(?P<cat>\w+))?"#],
+      None,
+      Some("https://example.com/{cat}/{id}"),
+    );
+    let values = extractor
+      .extract("https://example.com/", b"id=1&cat=food id=2")
+      .unwrap();
+
+    assert_eq!(values["id"], vec!["1", "2"]);
+    assert_eq!(values[LINKS_KEY], vec!["https://example.com/food/1"]);
+  }
+
+  #[test]
+  fn page_globs_gate_the_extraction() {
+    let extractor = extractor(
+      &[r"id=(?P<id>\d+)"],
+      Some(&["https://example.com/search*"]),
+      None,
+    );
+
+    assert!(extractor
+      .extract("https://example.com/about", b"id=1")
+      .is_none());
+    assert_eq!(
+      extractor
+        .extract("https://example.com/search?page=2", b"id=1")
+        .unwrap()["id"],
+      vec!["1"]
+    );
+  }
+
+  #[test]
+  fn values_are_deduped_in_order() {
+    let extractor = extractor(&[r"id=(?P<id>\d+)"], None, None);
+    let values = extractor
+      .extract("https://example.com/", b"id=3 id=1 id=3 id=2 id=1")
+      .unwrap();
+
+    assert_eq!(values["id"], vec!["3", "1", "2"]);
+    assert!(!values.contains_key(LINKS_KEY));
+  }
+
+  #[test]
+  fn unnamed_patterns_use_the_match_key() {
+    let extractor = extractor(&[r"SKU-\d+"], None, None);
+    let values = extractor
+      .extract("https://example.com/", b"SKU-1 and SKU-22")
+      .unwrap();
+
+    assert_eq!(values[MATCH_KEY], vec!["SKU-1", "SKU-22"]);
+    assert!(extractor
+      .extract("https://example.com/", b"nothing")
+      .is_none());
+  }
+
+  #[test]
+  fn spec_round_trips() {
+    let extractor = extractor(
+      &[r"id=(?P<id>\d+)"],
+      Some(&["*/search*"]),
+      Some("https://example.com/{id}"),
+    );
+    let spec: LinkExtractorSpec =
+      serde_json::from_str(&serde_json::to_string(extractor.spec()).unwrap()).unwrap();
+    let rebuilt = LinkExtractor::from_spec(&spec).unwrap();
+
+    assert_eq!(
+      rebuilt
+        .extract("https://example.com/search", b"id=4")
+        .unwrap()[LINKS_KEY],
+      vec!["https://example.com/4"]
+    );
+    assert!(rebuilt
+      .extract("https://example.com/about", b"id=4")
+      .is_none());
+  }
+
+  #[test]
+  fn invalid_patterns_are_errors() {
+    assert!(LinkExtractor::new(&["(unclosed".into()], None, None).is_err());
+    assert!(LinkExtractor::new(&["ok".into()], Some(&["[".into()]), None).is_err());
+  }
+}
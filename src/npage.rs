@@ -1,14 +1,17 @@
-use crate::page::header_map_to_hash_map;
+use crate::link_extractor::LinkExtractor;
+use crate::page::{header_map_to_hash_map, header_map_to_hash_map_filtered};
 use pyo3::prelude::*;
+use serde::{Deserialize, Serialize};
 use spider::lazy_static::lazy_static;
 use std::collections::{HashMap, HashSet};
+use std::sync::Arc;
 
 lazy_static! {
   static ref TITLE_SELECTOR: scraper::Selector = scraper::Selector::parse("title").unwrap();
 }
 
 /// a simple page object
-#[derive(Default, Clone)]
+#[derive(Default, Clone, Serialize, Deserialize)]
 #[pyclass]
 pub struct NPage {
   #[pyo3(get)]
@@ -29,6 +32,99 @@ pub struct NPage {
   #[pyo3(get)]
   /// The links found on the page. Requires the website.builder method website.with_subscription_return_page_links to be set to true.
   pub links: Option<HashSet<String>>,
+  #[pyo3(get)]
+  /// The values captured by the link extractor keyed by group name. Requires the website.builder method website.with_link_extractor to be set.
+  pub extracted: Option<HashMap<String, Vec<String>>>,
+}
+
+/// the options used to build a page.
+#[derive(Default, Clone)]
+pub struct PageOptions {
+  /// do not convert content to UTF-8.
+  pub raw: bool,
+  /// extract ids and links from the page bytes.
+  pub link_extractor: Option<Arc<LinkExtractor>>,
+  /// the fields to materialize. All fields are built if not set.
+  pub fields: Option<Arc<PageFields>>,
+}
+
+/// the page fields to materialize. The url and status code are always set.
+#[derive(Debug, Default, Clone, Serialize, Deserialize)]
+pub struct PageFields {
+  /// build the content or raw content.
+  pub content: bool,
+  /// build the headers.
+  pub headers: bool,
+  /// build the links.
+  pub links: bool,
+  /// run the link extractor.
+  pub extracted: bool,
+  /// only keep the headers named.
+  pub header_names: Option<Vec<String>>,
+  /// the max amount of body bytes kept.
+  pub max_body_size: Option<usize>,
+}
+
+impl PageFields {
+  /// every page field.
+  pub fn all() -> Self {
+    PageFields {
+      content: true,
+      headers: true,
+      links: true,
+      extracted: true,
+      ..Default::default()
+    }
+  }
+
+  /// select the fields by name returning the unknown names. All fields are selected when no names are passed. A header allow-list selects the headers and a max body size selects the content.
+  pub fn new(
+    fields: Option<&[String]>,
+    header_names: Option<Vec<String>>,
+    max_body_size: Option<usize>,
+  ) -> (Self, Vec<String>) {
+    let header_names: Option<Vec<String>> = header_names
+      .filter(|h| !h.is_empty())
+      .map(|h| h.into_iter().map(|n| n.to_lowercase()).collect());
+    let mut unknown = Vec::new();
+
+    let mut page_fields = match fields {
+      Some(fields) => {
+        let mut page_fields = PageFields::default();
+
+        for field in fields {
+          match field.as_str() {
+            "url" | "status_code" => (),
+            "content" | "raw_content" => page_fields.content = true,
+            "headers" => page_fields.headers = true,
+            "links" => page_fields.links = true,
+            "extracted" => page_fields.extracted = true,
+            _ => unknown.push(field.clone()),
+          }
+        }
+
+        page_fields
+      }
+      _ => PageFields::all(),
+    };
+
+    page_fields.headers |= header_names.is_some();
+    page_fields.content |= max_body_size.is_some();
+    page_fields.header_names = header_names;
+    page_fields.max_body_size = max_body_size;
+
+    (page_fields, unknown)
+  }
+}
+
+impl PageOptions {
+  /// new page options.
+  pub fn new(raw: bool) -> Self {
+    PageOptions {
+      raw,
+      ..Default::default()
+    }
+  }
 }
 
 /// get the page title.
@@ -36,27 +132,70 @@ pub fn page_title(page: NPage) -> String {
   page.title()
 }
 
+/// get the page body as UTF-8 truncated to the max size in bytes. Only the bytes kept are decoded, pages past the cap are read as UTF-8.
+fn page_content(res: &spider::page::Page, max_body_size: Option<usize>) -> String {
+  match max_body_size {
+    Some(max) => {
+      let bytes = res.get_html_bytes_u8();
+
+      if bytes.len() > max {
+        String::from_utf8_lossy(truncate_utf8(bytes, max)).into_owned()
+      } else {
+        res.get_html()
+      }
+    }
+    _ => res.get_html(),
+  }
+}
+
+/// truncate the bytes to the max size without splitting a UTF-8 sequence.
+fn truncate_utf8(bytes: &[u8], max: usize) -> &[u8] {
+  if bytes.len() <= max {
+    return bytes;
+  }
+
+  let mut end = max;
+  // back off the continuation bytes of a sequence split by the cap.
+  while end > 0 && max - end < 3 && bytes[end] & 0b1100_0000 == 0b1000_0000 {
+    end -= 1;
+  }
+
+  &bytes[..end]
+}
+
 /// get a new Page
-pub fn new_page(res: &spider::page::Page, raw: bool) -> NPage {
+pub fn new_page(res: &spider::page::Page, options: &PageOptions) -> NPage {
+  let raw = options.raw;
+  let default_fields = PageFields::all();
+  let fields = match options.fields {
+    Some(ref fields) => fields.as_ref(),
+    _ => &default_fields,
+  };
+
   NPage {
     url: res.get_url().into(),
     status_code: res.status_code.as_u16(),
-    content: if raw {
+    content: if raw || !fields.content {
       Default::default()
     } else {
-      res.get_html()
+      page_content(res, fields.max_body_size)
     },
-    raw_content: if raw {
-      Some(res.get_html_bytes_u8().into())
+    raw_content: if raw && fields.content {
+      let bytes = res.get_html_bytes_u8();
+      let max = fields.max_body_size.unwrap_or(bytes.len());
+      Some(bytes[..bytes.len().min(max)].into())
     } else {
       None
     },
     headers: match res.headers {
-      Some(ref headers) => Some(header_map_to_hash_map(headers)),
+      Some(ref headers) if fields.headers => Some(match fields.header_names {
+        Some(ref names) => header_map_to_hash_map_filtered(headers, names),
+        _ => header_map_to_hash_map(headers),
+      }),
       _ => None,
     },
     links: match res.page_links {
-      Some(ref links) => Some(
+      Some(ref links) if fields.links => Some(
         links
           .iter()
           .map(|link| link.as_ref().to_string())
@@ -64,6 +203,12 @@ pub fn new_page(res: &spider::page::Page, raw: bool) -> NPage {
       ),
       _ => None,
     },
+    extracted: match options.link_extractor {
+      Some(ref extractor) if fields.extracted => {
+        extractor.extract(res.get_url(), res.get_html_bytes_u8())
+      }
+      _ => None,
+    },
   }
 }
 
@@ -81,3 +226,44 @@ impl NPage {
     }
   }
 }
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  #[test]
+  fn header_names_and_body_size_select_their_fields() {
+    let (fields, unknown) = PageFields::new(None, Some(vec!["Content-Type".into()]), Some(1024));
+    assert!(unknown.is_empty());
+    assert!(fields.content && fields.headers && fields.links && fields.extracted);
+    assert_eq!(fields.header_names, Some(vec!["content-type".to_string()]));
+    assert_eq!(fields.max_body_size, Some(1024));
+
+    let (fields, _) = PageFields::new(Some(&["links".into()]), Some(vec!["etag".into()]), None);
+    assert!(fields.links && fields.headers);
+    assert!(!fields.content && !fields.extracted);
+
+    let (fields, _) = PageFields::new(Some(&["links".into()]), None, Some(10));
+    assert!(fields.links && fields.content);
+    assert!(!fields.headers);
+
+    let (fields, unknown) =
+      PageFields::new(Some(&["url".into(), "body".into()]), Some(vec![]), None);
+    assert!(!fields.content && !fields.headers && fields.header_names.is_none());
+    assert_eq!(unknown, vec!["body".to_string()]);
+  }
+
+  #[test]
+  fn truncate_utf8_keeps_whole_chars() {
+    let text = "añ€😀";
+    let bytes = text.as_bytes();
+
+    assert_eq!(truncate_utf8(bytes, 100), bytes);
+    assert_eq!(truncate_utf8(bytes, 2), b"a");
+    assert_eq!(truncate_utf8(bytes, 3), "añ".as_bytes());
+    assert_eq!(truncate_utf8(bytes, 5), "añ".as_bytes());
+    assert_eq!(truncate_utf8(bytes, 6), "añ€".as_bytes());
+    assert_eq!(truncate_utf8(bytes, 9), "añ€".as_bytes());
+    assert_eq!(truncate_utf8(bytes, 0), b"");
+  }
+}
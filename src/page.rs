@@ -43,6 +43,24 @@ pub fn header_map_to_hash_map(header_map: &HeaderMap) -> HashMap<String, String>
   hash_map
 }
 
+/// convert the named headers of a headermap to hashmap
+pub fn header_map_to_hash_map_filtered(
+  header_map: &HeaderMap,
+  names: &[String],
+) -> HashMap<String, String> {
+  let mut hash_map = HashMap::with_capacity(names.len());
+
+  for name in names {
+    if let Some(value) = header_map.get(name.as_str()) {
+      if let Ok(value_str) = value.to_str() {
+        hash_map.insert(name.clone(), value_str.to_string());
+      }
+    }
+  }
+
+  hash_map
+}
+
 #[pymethods]
 impl Page {
   /// A new page to collect.
@@ -0,0 +1,690 @@
+use crate::NPage;
+use memmap2::Mmap;
+use pyo3::exceptions::{PyIOError, PyIndexError};
+use pyo3::prelude::*;
+use std::collections::{HashMap, HashSet, VecDeque};
+use std::fs::{File, OpenOptions};
+use std::io::{BufWriter, Write};
+use std::path::PathBuf;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::mpsc::{sync_channel, SyncSender};
+use std::sync::{Arc, Mutex};
+use std::thread::JoinHandle;
+
+/// the default amount of page bytes kept in memory before spilling to disk.
+pub const DEFAULT_MEMORY_LIMIT: usize = 64 * 1024 * 1024;
+/// the amount of pages queued for the writer thread before the crawl waits.
+const WRITER_QUEUE: usize = 32;
+/// the zstd level used when compressing segment records.
+const ZSTD_LEVEL: i32 = 3;
+
+/// unique id for segment files created by the process.
+static SEGMENT_ID: AtomicUsize = AtomicUsize::new(0);
+
+/// the record flag for raw content.
+const FLAG_RAW: u8 = 1;
+/// the record flag for headers.
+const FLAG_HEADERS: u8 = 1 << 1;
+/// the record flag for links.
+const FLAG_LINKS: u8 = 1 << 2;
+/// the record flag for extracted values.
+const FLAG_EXTRACTED: u8 = 1 << 3;
+
+/// the configuration for the page store.
+#[derive(Debug, Clone, Default)]
+pub struct PageStoreConfig {
+  /// the max amount of page bytes kept in memory.
+  pub memory_limit: usize,
+  /// the directory to create the segment file in.
+  pub directory: Option<PathBuf>,
+  /// compress the records with zstd.
+  pub compress: bool,
+}
+
+/// the append-only segment file holding the spilled pages.
+struct Segment {
+  /// the path of the segment file.
+  path: PathBuf,
+  /// the buffered writer appending records.
+  writer: BufWriter<File>,
+  /// the amount of bytes written.
+  len: u64,
+  /// the read only map of the file.
+  mmap: Option<Mmap>,
+}
+
+impl Segment {
+  /// create a new segment file.
+  fn create(directory: &Option<PathBuf>) -> std::io::Result<Segment> {
+    let dir = match directory {
+      Some(d) => d.clone(),
+      _ => std::env::temp_dir(),
+    };
+    let path = dir.join(format!(
+      "spider_rs-{}-{}.seg",
+      std::process::id(),
+      SEGMENT_ID.fetch_add(1, Ordering::Relaxed)
+    ));
+    let file = OpenOptions::new()
+      .create_new(true)
+      .read(true)
+      .append(true)
+      .open(&path)?;
+
+    Ok(Segment {
+      path,
+      writer: BufWriter::new(file),
+      len: 0,
+      mmap: None,
+    })
+  }
+
+  /// append a record returning the offset.
+  fn append(&mut self, record: &[u8]) -> std::io::Result<u64> {
+    let offset = self.len;
+    self.writer.write_all(record)?;
+    self.len += record.len() as u64;
+    Ok(offset)
+  }
+
+  /// read a record mapping the file again if it grew past the current map.
+  fn read(&mut self, offset: u64, len: usize) -> std::io::Result<&[u8]> {
+    let end = offset as usize + len;
+    let mapped = match &self.mmap {
+      Some(m) => m.len(),
+      _ => 0,
+    };
+
+    if end > mapped {
+      self.writer.flush()?;
+      // the file is only appended to so the mapped region is never truncated.
+      self.mmap = Some(unsafe { Mmap::map(self.writer.get_ref())? });
+    }
+
+    match &self.mmap {
+      Some(m) if end <= m.len() => Ok(&m[offset as usize..end]),
+      _ => Err(std::io::Error::new(
+        std::io::ErrorKind::UnexpectedEof,
+        "page record out of bounds",
+      )),
+    }
+  }
+}
+
+impl Drop for Segment {
+  fn drop(&mut self) {
+    self.mmap.take();
+    let _ = std::fs::remove_file(&self.path);
+  }
+}
+
+/// a page store keeping a bounded window of pages in memory and spilling the rest to disk.
+pub struct PageStore {
+  /// the store configuration.
+  config: PageStoreConfig,
+  /// the most recent pages kept in memory.
+  memory: VecDeque<(NPage, usize)>,
+  /// the amount of bytes held in memory.
+  memory_size: usize,
+  /// the offset and length of every page spilled in order.
+  index: Vec<(u64, usize)>,
+  /// the segment file created on the first spill.
+  segment: Option<Segment>,
+  /// the amount of pages the crawl dropped before they reached the store.
+  skipped: usize,
+}
+
+impl PageStore {
+  /// a new page store.
+  pub fn new(config: PageStoreConfig) -> Self {
+    PageStore {
+      config,
+      memory: VecDeque::new(),
+      memory_size: 0,
+      index: Vec::new(),
+      segment: None,
+      skipped: 0,
+    }
+  }
+
+  /// the amount of pages stored.
+  pub fn len(&self) -> usize {
+    self.index.len() + self.memory.len()
+  }
+
+  /// is the store empty.
+  pub fn is_empty(&self) -> bool {
+    self.len() == 0
+  }
+
+  /// the amount of pages spilled to disk.
+  pub fn spilled(&self) -> usize {
+    self.index.len()
+  }
+
+  /// the amount of pages dropped by the crawl subscription before reaching the store.
+  pub fn skipped(&self) -> usize {
+    self.skipped
+  }
+
+  /// record pages dropped by the crawl subscription.
+  pub fn add_skipped(&mut self, amount: usize) {
+    self.skipped += amount;
+  }
+
+  /// add a page evicting the oldest pages to disk when the memory limit is reached.
+  pub fn push(&mut self, page: NPage) -> std::io::Result<()> {
+    let size = page_size(&page);
+
+    self.memory_size += size;
+    self.memory.push_back((page, size));
+
+    while self.memory_size > self.config.memory_limit && !self.memory.is_empty() {
+      if let Some((page, size)) = self.memory.pop_front() {
+        self.memory_size -= size;
+        self.spill(&page)?;
+      }
+    }
+
+    Ok(())
+  }
+
+  /// write a page to the segment file.
+  fn spill(&mut self, page: &NPage) -> std::io::Result<()> {
+    let mut record = encode_page(page);
+
+    if self.config.compress {
+      record = zstd::encode_all(&record[..], ZSTD_LEVEL)?;
+    }
+
+    if self.segment.is_none() {
+      self.segment = Some(Segment::create(&self.config.directory)?);
+    }
+
+    if let Some(segment) = self.segment.as_mut() {
+      let offset = segment.append(&record)?;
+      self.index.push((offset, record.len()));
+    }
+
+    Ok(())
+  }
+
+  /// get a page by position decoding it from disk if needed.
+  pub fn get(&mut self, index: usize) -> std::io::Result<Option<NPage>> {
+    if index < self.index.len() {
+      let (offset, len) = self.index[index];
+      let compress = self.config.compress;
+
+      match self.segment.as_mut() {
+        Some(segment) => {
+          let record = segment.read(offset, len)?;
+          let page = if compress {
+            decode_page(&zstd::decode_all(record)?)
+          } else {
+            decode_page(record)
+          };
+          page.map(Some)
+        }
+        _ => Ok(None),
+      }
+    } else {
+      Ok(
+        self
+          .memory
+          .get(index - self.index.len())
+          .map(|(page, _)| page.clone()),
+      )
+    }
+  }
+
+  /// remove all pages and the segment file.
+  pub fn clear(&mut self) {
+    self.memory.clear();
+    self.memory_size = 0;
+    self.index.clear();
+    self.segment.take();
+    self.skipped = 0;
+  }
+}
+
+/// a writer thread pushing the pages into the store so compression and disk writes never run on the crawl subscription. The queue is bounded so a slow disk blocks the sender instead of holding the pages in memory.
+pub struct PageWriter {
+  /// the queue of pages to store.
+  sender: Option<SyncSender<NPage>>,
+  /// the writer thread.
+  handle: Option<JoinHandle<()>>,
+}
+
+impl PageWriter {
+  /// spawn a writer thread for the store.
+  pub fn spawn(store: Arc<Mutex<PageStore>>) -> Self {
+    let (sender, receiver) = sync_channel::<NPage>(WRITER_QUEUE);
+
+    let handle = std::thread::spawn(move || {
+      for page in receiver {
+        if let Ok(mut store) = store.lock() {
+          if let Err(e) = store.push(page) {
+            spider::utils::log("page store", e.to_string());
+          }
+        }
+      }
+    });
+
+    PageWriter {
+      sender: Some(sender),
+      handle: Some(handle),
+    }
+  }
+
+  /// queue a page to store blocking while the queue is full.
+  pub fn send(&self, page: NPage) {
+    if let Some(sender) = &self.sender {
+      let _ = sender.send(page);
+    }
+  }
+
+  /// wait for the queued pages to be stored.
+  pub fn finish(&mut self) {
+    self.sender.take();
+
+    if let Some(handle) = self.handle.take() {
+      let _ = handle.join();
+    }
+  }
+}
+
+impl Drop for PageWriter {
+  fn drop(&mut self) {
+    self.finish();
+  }
+}
+
+/// the approximate amount of bytes a page holds.
+fn page_size(page: &NPage) -> usize {
+  let mut size = page.url.len() + page.content.len();
+
+  if let Some(raw) = &page.raw_content {
+    size += raw.len();
+  }
+  if let Some(headers) = &page.headers {
+    size += headers
+      .iter()
+      .map(|(k, v)| k.len() + v.len())
+      .sum::<usize>();
+  }
+  if let Some(links) = &page.links {
+    size += links.iter().map(|l| l.len()).sum::<usize>();
+  }
+  if let Some(extracted) = &page.extracted {
+    for (k, v) in extracted.iter() {
+      size += k.len() + v.iter().map(|l| l.len()).sum::<usize>();
+    }
+  }
+
+  size
+}
+
+/// write a length prefixed value.
+fn put_bytes(buf: &mut Vec<u8>, value: &[u8]) {
+  buf.extend_from_slice(&(value.len() as u32).to_le_bytes());
+  buf.extend_from_slice(value);
+}
+
+/// encode a page into a segment record.
+fn encode_page(page: &NPage) -> Vec<u8> {
+  let mut buf = Vec::with_capacity(page_size(page) + 64);
+  let mut flags = 0;
+
+  if page.raw_content.is_some() {
+    flags |= FLAG_RAW;
+  }
+  if page.headers.is_some() {
+    flags |= FLAG_HEADERS;
+  }
+  if page.links.is_some() {
+    flags |= FLAG_LINKS;
+  }
+  if page.extracted.is_some() {
+    flags |= FLAG_EXTRACTED;
+  }
+
+  buf.push(flags);
+  buf.extend_from_slice(&page.status_code.to_le_bytes());
+  put_bytes(&mut buf, page.url.as_bytes());
+  put_bytes(&mut buf, page.content.as_bytes());
+
+  if let Some(raw) = &page.raw_content {
+    put_bytes(&mut buf, raw);
+  }
+  if let Some(headers) = &page.headers {
+    buf.extend_from_slice(&(headers.len() as u32).to_le_bytes());
+    for (k, v) in headers.iter() {
+      put_bytes(&mut buf, k.as_bytes());
+      put_bytes(&mut buf, v.as_bytes());
+    }
+  }
+  if let Some(links) = &page.links {
+    buf.extend_from_slice(&(links.len() as u32).to_le_bytes());
+    for link in links.iter() {
+      put_bytes(&mut buf, link.as_bytes());
+    }
+  }
+  if let Some(extracted) = &page.extracted {
+    buf.extend_from_slice(&(extracted.len() as u32).to_le_bytes());
+    for (k, v) in extracted.iter() {
+      put_bytes(&mut buf, k.as_bytes());
+      buf.extend_from_slice(&(v.len() as u32).to_le_bytes());
+      for value in v.iter() {
+        put_bytes(&mut buf, value.as_bytes());
+      }
+    }
+  }
+
+  buf
+}
+
+/// a cursor reading a segment record.
+struct Reader<'a> {
+  /// the record.
+  buf: &'a [u8],
+  /// the read position.
+  pos: usize,
+}
+
+impl<'a> Reader<'a> {
+  /// take the next bytes.
+  fn take(&mut self, len: usize) -> std::io::Result<&'a [u8]> {
+    match self.buf.get(self.pos..self.pos + len) {
+      Some(v) => {
+        self.pos += len;
+        Ok(v)
+      }
+      _ => Err(std::io::Error::new(
+        std::io::ErrorKind::InvalidData,
+        "truncated page record",
+      )),
+    }
+  }
+
+  /// read a u32.
+  fn u32(&mut self) -> std::io::Result<u32> {
+    let mut b = [0u8; 4];
+    b.copy_from_slice(self.take(4)?);
+    Ok(u32::from_le_bytes(b))
+  }
+
+  /// read length prefixed bytes.
+  fn bytes(&mut self) -> std::io::Result<&'a [u8]> {
+    let len = self.u32()? as usize;
+    self.take(len)
+  }
+
+  /// read a length prefixed string.
+  fn string(&mut self) -> std::io::Result<String> {
+    Ok(String::from_utf8_lossy(self.bytes()?).into_owned())
+  }
+}
+
+/// decode a segment record into a page.
+fn decode_page(record: &[u8]) -> std::io::Result<NPage> {
+  let mut r = Reader {
+    buf: record,
+    pos: 0,
+  };
+  let flags = r.take(1)?[0];
+  let mut status = [0u8; 2];
+  status.copy_from_slice(r.take(2)?);
+
+  let mut page = NPage {
+    status_code: u16::from_le_bytes(status),
+    url: r.string()?,
+    content: r.string()?,
+    ..Default::default()
+  };
+
+  if flags & FLAG_RAW != 0 {
+    page.raw_content = Some(r.bytes()?.to_vec());
+  }
+  if flags & FLAG_HEADERS != 0 {
+    let count = r.u32()? as usize;
+    let mut headers = HashMap::with_capacity(count);
+    for _ in 0..count {
+      let k = r.string()?;
+      let v = r.string()?;
+      headers.insert(k, v);
+    }
+    page.headers = Some(headers);
+  }
+  if flags & FLAG_LINKS != 0 {
+    let count = r.u32()? as usize;
+    let mut links = HashSet::with_capacity(count);
+    for _ in 0..count {
+      links.insert(r.string()?);
+    }
+    page.links = Some(links);
+  }
+  if flags & FLAG_EXTRACTED != 0 {
+    let count = r.u32()? as usize;
+    let mut extracted = HashMap::with_capacity(count);
+    for _ in 0..count {
+      let k = r.string()?;
+      let len = r.u32()? as usize;
+      let mut values = Vec::with_capacity(len);
+      for _ in 0..len {
+        values.push(r.string()?);
+      }
+      extracted.insert(k, values);
+    }
+    page.extracted = Some(extracted);
+  }
+
+  Ok(page)
+}
+
+/// resolve a python index that may be negative into a position within the length.
+fn resolve_index(index: isize, len: usize) -> Option<usize> {
+  let i = if index < 0 {
+    index + len as isize
+  } else {
+    index
+  };
+
+  if i < 0 || i as usize >= len {
+    None
+  } else {
+    Some(i as usize)
+  }
+}
+
+/// a lazy sequence of the pages stored decoding a page only when accessed.
+#[pyclass]
+pub struct PageSequence {
+  /// the shared page store.
+  store: Arc<Mutex<PageStore>>,
+  /// the amount of pages when the sequence was created.
+  len: usize,
+}
+
+impl PageSequence {
+  /// a new sequence over the pages currently stored.
+  pub fn new(store: Arc<Mutex<PageStore>>) -> Self {
+    let len = match store.lock() {
+      Ok(s) => s.len(),
+      _ => 0,
+    };
+    PageSequence { store, len }
+  }
+}
+
+#[pymethods]
+impl PageSequence {
+  fn __len__(&self) -> usize {
+    self.len
+  }
+
+  fn __getitem__(&self, index: isize) -> PyResult<NPage> {
+    let i = match resolve_index(index, self.len) {
+      Some(i) => i,
+      _ => return Err(PyIndexError::new_err("page index out of range")),
+    };
+
+    let page = match self.store.lock() {
+      Ok(mut store) => store.get(i),
+      Err(e) => return Err(PyIOError::new_err(e.to_string())),
+    };
+
+    match page {
+      Ok(Some(page)) => Ok(page),
+      Ok(None) => Err(PyIndexError::new_err("page was cleared from the store")),
+      Err(e) => Err(PyIOError::new_err(e.to_string())),
+    }
+  }
+
+  /// the amount of pages held on disk.
+  #[getter]
+  pub fn spilled(&self) -> usize {
+    match self.store.lock() {
+      Ok(s) => s.spilled().min(self.len),
+      _ => 0,
+    }
+  }
+
+  /// the amount of pages the crawl dropped before they reached the store because the subscription lagged.
+  #[getter]
+  pub fn skipped(&self) -> usize {
+    match self.store.lock() {
+      Ok(s) => s.skipped(),
+      _ => 0,
+    }
+  }
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  /// a page with every field set.
+  fn full_page(i: usize) -> NPage {
+    NPage {
+      url: format!("https://example.com/{i}"),
+      content: format!("<html>page {i} ñ</html>"),
+      status_code: 200,
+      raw_content: Some(vec![0, 159, 146, 150, i as u8]),
+      headers: Some(HashMap::from([(
+        "content-type".to_string(),
+        "text/html".to_string(),
+      )])),
+      links: Some(HashSet::from([format!("https://example.com/{}", i + 1)])),
+      extracted: Some(HashMap::from([(
+        "id".to_string(),
+        vec![i.to_string(), "x".to_string()],
+      )])),
+    }
+  }
+
+  /// assert the pages hold the same values.
+  fn assert_same(a: &NPage, b: &NPage) {
+    assert_eq!(a.url, b.url);
+    assert_eq!(a.content, b.content);
+    assert_eq!(a.status_code, b.status_code);
+    assert_eq!(a.raw_content, b.raw_content);
+    assert_eq!(a.headers, b.headers);
+    assert_eq!(a.links, b.links);
+    assert_eq!(a.extracted, b.extracted);
+  }
+
+  /// store pages past the memory limit reading every page back.
+  fn spill_round_trip(compress: bool) {
+    let dir = std::env::temp_dir();
+    let mut store = PageStore::new(PageStoreConfig {
+      memory_limit: 256,
+      directory: Some(dir),
+      compress,
+    });
+
+    for i in 0..50 {
+      store.push(full_page(i)).unwrap();
+    }
+
+    assert_eq!(store.len(), 50);
+    assert!(store.spilled() > 0);
+    assert!(store.spilled() < 50);
+
+    for i in 0..50 {
+      assert_same(&store.get(i).unwrap().unwrap(), &full_page(i));
+    }
+    assert!(store.get(50).unwrap().is_none());
+
+    let path = store.segment.as_ref().map(|s| s.path.clone()).unwrap();
+    assert!(path.exists());
+    store.clear();
+    assert!(!path.exists());
+    assert!(store.is_empty());
+  }
+
+  #[test]
+  fn encode_decode_round_trip() {
+    let page = full_page(7);
+    assert_same(&decode_page(&encode_page(&page)).unwrap(), &page);
+
+    let page = NPage {
+      url: "https://example.com".into(),
+      status_code: 404,
+      ..Default::default()
+    };
+    let decoded = decode_page(&encode_page(&page)).unwrap();
+    assert_same(&decoded, &page);
+    assert!(decoded.raw_content.is_none());
+    assert!(decoded.headers.is_none());
+    assert!(decoded.links.is_none());
+    assert!(decoded.extracted.is_none());
+  }
+
+  #[test]
+  fn decode_truncated_record() {
+    let record = encode_page(&full_page(1));
+    assert!(decode_page(&record[..record.len() - 1]).is_err());
+    assert!(decode_page(&[]).is_err());
+  }
+
+  #[test]
+  fn spill_uncompressed() {
+    spill_round_trip(false);
+  }
+
+  #[test]
+  fn spill_compressed() {
+    spill_round_trip(true);
+  }
+
+  #[test]
+  fn writer_stores_every_page() {
+    let store = Arc::new(Mutex::new(PageStore::new(PageStoreConfig {
+      memory_limit: 128,
+      directory: None,
+      compress: true,
+    })));
+    let mut writer = PageWriter::spawn(store.clone());
+
+    for i in 0..100 {
+      writer.send(full_page(i));
+    }
+    writer.finish();
+
+    let mut store = store.lock().unwrap();
+    assert_eq!(store.len(), 100);
+    assert_same(&store.get(99).unwrap().unwrap(), &full_page(99));
+  }
+
+  #[test]
+  fn resolve_python_index() {
+    assert_eq!(resolve_index(0, 3), Some(0));
+    assert_eq!(resolve_index(2, 3), Some(2));
+    assert_eq!(resolve_index(-1, 3), Some(2));
+    assert_eq!(resolve_index(-3, 3), Some(0));
+    assert_eq!(resolve_index(3, 3), None);
+    assert_eq!(resolve_index(-4, 3), None);
+    assert_eq!(resolve_index(0, 0), None);
+    assert_eq!(resolve_index(-1, 0), None);
+  }
+}
@@ -1,5 +1,6 @@
 use crate::new_page;
 use crate::NWebsite;
+use crate::PageOptions;
 use crate::BUFFER;
 
 // base website crawl
@@ -9,11 +10,11 @@ pub async fn crawl(url: String, raw_content: Option<bool>) -> NWebsite {
     .subscribe(*BUFFER / 2)
     .expect("sync feature should be enabled");
   let (tx, mut rx) = spider::tokio::sync::mpsc::channel(*BUFFER);
-  let raw_content = raw_content.unwrap_or_default();
+  let options = PageOptions::new(raw_content.unwrap_or_default());
 
   spider::tokio::spawn(async move {
     while let Ok(res) = rx2.recv().await {
-      if let Err(_) = tx.send(new_page(&res, raw_content)).await {
+      if let Err(_) = tx.send(new_page(&res, &options)).await {
         println!("receiver dropped");
         return;
       }
@@ -0,0 +1,400 @@
+use spider::tokio::sync::Notify;
+use std::collections::HashMap;
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+/// the concurrency factor applied when the host throttles the requests.
+const THROTTLED_DECREASE: f64 = 0.5;
+/// the concurrency factor applied when the host responds slower than the target latency.
+const SLOW_DECREASE: f64 = 0.75;
+/// the delay removed on every fast response.
+const DELAY_STEP: Duration = Duration::from_millis(10);
+/// the smallest delay used when backing off from no delay.
+const BACKOFF_DELAY: Duration = Duration::from_millis(250);
+/// the weight of the new sample in the latency moving average.
+const LATENCY_WEIGHT: f64 = 0.2;
+
+/// the bounds of the adaptive throttle.
+#[derive(Debug, Clone)]
+pub struct ThrottleConfig {
+  /// the min delay between requests to a host.
+  pub min_delay: Duration,
+  /// the max delay between requests to a host.
+  pub max_delay: Duration,
+  /// the max in-flight requests to a host.
+  pub max_concurrency: usize,
+  /// back off when responses are slower than the latency.
+  pub target_latency: Duration,
+}
+
+impl ThrottleConfig {
+  /// check the bounds are valid.
+  pub fn validate(&self) -> Result<(), String> {
+    if self.min_delay > self.max_delay {
+      return Err(format!(
+        "min_delay {}ms is greater than max_delay {}ms",
+        self.min_delay.as_millis(),
+        self.max_delay.as_millis()
+      ));
+    }
+    if self.max_concurrency == 0 {
+      return Err("max_concurrency must be at least 1".into());
+    }
+    Ok(())
+  }
+}
+
+impl Default for ThrottleConfig {
+  fn default() -> Self {
+    ThrottleConfig {
+      min_delay: Duration::ZERO,
+      max_delay: Duration::from_secs(30),
+      max_concurrency: 8,
+      target_latency: Duration::from_secs(2),
+    }
+  }
+}
+
+/// the limits of a host.
+#[derive(Debug, Clone)]
+struct HostState {
+  /// the in-flight request limit.
+  concurrency: f64,
+  /// the delay between requests.
+  delay: Duration,
+  /// the moving average of the response latency.
+  latency: Option<Duration>,
+  /// the amount of throttled responses.
+  throttled: usize,
+  /// the requests in flight.
+  in_flight: usize,
+  /// the time of the last request.
+  last_request: Option<Instant>,
+  /// wait for the time set by retry-after.
+  retry_until: Option<Instant>,
+  /// are the requests to the host gated by the concurrency limit.
+  gated: bool,
+}
+
+/// adjust the per host concurrency and delay from the latency and throttled responses (AIMD).
+pub struct AdaptiveThrottle {
+  /// the throttle bounds.
+  config: ThrottleConfig,
+  /// the state of every host.
+  hosts: Mutex<HashMap<String, HostState>>,
+  /// wake the requests waiting for a slot.
+  notify: Notify,
+}
+
+/// a request slot for a host released on drop.
+pub struct ThrottlePermit {
+  /// the throttle.
+  throttle: Arc<AdaptiveThrottle>,
+  /// the host.
+  host: String,
+}
+
+impl Drop for ThrottlePermit {
+  fn drop(&mut self) {
+    if let Ok(mut hosts) = self.throttle.hosts.lock() {
+      if let Some(state) = hosts.get_mut(&self.host) {
+        state.in_flight = state.in_flight.saturating_sub(1);
+      }
+    }
+    self.throttle.notify.notify_waiters();
+  }
+}
+
+/// get the host of the url.
+pub fn url_host(url: &str) -> String {
+  match url::Url::parse(url) {
+    Ok(u) => u.host_str().unwrap_or_default().to_string(),
+    _ => Default::default(),
+  }
+}
+
+/// get the retry-after delay in seconds from the headers.
+pub fn retry_after(headers: &spider::reqwest::header::HeaderMap) -> Option<Duration> {
+  headers
+    .get(spider::reqwest::header::RETRY_AFTER)
+    .and_then(|v| v.to_str().ok())
+    .and_then(|v| v.trim().parse::<u64>().ok())
+    .map(Duration::from_secs)
+}
+
+impl AdaptiveThrottle {
+  /// a new adaptive throttle.
+  pub fn new(config: ThrottleConfig) -> Self {
+    AdaptiveThrottle {
+      config,
+      hosts: Mutex::new(HashMap::new()),
+      notify: Notify::new(),
+    }
+  }
+
+  /// the initial state of a host.
+  fn host_state(&self) -> HostState {
+    HostState {
+      concurrency: 1.0,
+      delay: self.config.min_delay,
+      latency: None,
+      throttled: 0,
+      in_flight: 0,
+      last_request: None,
+      retry_until: None,
+      gated: false,
+    }
+  }
+
+  /// wait for a request slot for the host.
+  pub async fn acquire(self: &Arc<Self>, host: &str) -> ThrottlePermit {
+    loop {
+      let notified = self.notify.notified();
+      spider::tokio::pin!(notified);
+      notified.as_mut().enable();
+
+      let wait = match self.hosts.lock() {
+        Ok(mut hosts) => {
+          let fresh = self.host_state();
+          let state = hosts.entry(host.to_string()).or_insert(fresh);
+          let now = Instant::now();
+          let mut wait = Duration::ZERO;
+          state.gated = true;
+
+          if let Some(until) = state.retry_until {
+            wait = wait.max(until.saturating_duration_since(now));
+          }
+          if let Some(last) = state.last_request {
+            wait = wait.max((last + state.delay).saturating_duration_since(now));
+          }
+
+          if wait.is_zero() && state.in_flight < (state.concurrency as usize).max(1) {
+            state.in_flight += 1;
+            state.last_request = Some(now);
+            state.retry_until = None;
+            None
+          } else {
+            Some(wait)
+          }
+        }
+        _ => None,
+      };
+
+      match wait {
+        None => {
+          return ThrottlePermit {
+            throttle: self.clone(),
+            host: host.to_string(),
+          }
+        }
+        Some(wait) if !wait.is_zero() => spider::tokio::time::sleep(wait).await,
+        _ => notified.await,
+      }
+    }
+  }
+
+  /// record a response for the host returning the time to back off if the host is throttling.
+  pub fn record(
+    &self,
+    host: &str,
+    status: u16,
+    latency: Option<Duration>,
+    retry_after: Option<Duration>,
+  ) -> Option<Duration> {
+    let config = &self.config;
+    let mut hosts = self.hosts.lock().ok()?;
+    let fresh = self.host_state();
+    let state = hosts.entry(host.to_string()).or_insert(fresh);
+
+    if let Some(latency) = latency {
+      state.latency = Some(match state.latency {
+        Some(avg) => avg.mul_f64(1.0 - LATENCY_WEIGHT) + latency.mul_f64(LATENCY_WEIGHT),
+        _ => latency,
+      });
+    }
+
+    let backoff = if status == 429 || status == 503 {
+      state.throttled += 1;
+      state.concurrency = (state.concurrency * THROTTLED_DECREASE).max(1.0);
+      state.delay = (state.delay * 2).max(BACKOFF_DELAY).min(config.max_delay);
+
+      let wait = retry_after.unwrap_or(state.delay).min(config.max_delay);
+      state.retry_until = Some(Instant::now() + wait);
+      Some(wait)
+    } else if state.latency.is_some_and(|l| l > config.target_latency) {
+      state.concurrency = (state.concurrency * SLOW_DECREASE).max(1.0);
+      state.delay = (state.delay + DELAY_STEP).min(config.max_delay);
+      None
+    } else {
+      state.concurrency =
+        (state.concurrency + 1.0 / state.concurrency).min(config.max_concurrency.max(1) as f64);
+      state.delay = state.delay.saturating_sub(DELAY_STEP).max(config.min_delay);
+      None
+    };
+
+    drop(hosts);
+    self.notify.notify_waiters();
+
+    backoff
+  }
+
+  /// the current limits of every host. The concurrency and in-flight requests are only reported for the hosts gated by acquire.
+  pub fn limits(&self) -> HashMap<String, HashMap<String, f64>> {
+    match self.hosts.lock() {
+      Ok(hosts) => hosts
+        .iter()
+        .map(|(host, state)| {
+          let mut limits = HashMap::from([
+            ("delay".to_string(), state.delay.as_millis() as f64),
+            (
+              "latency".to_string(),
+              state
+                .latency
+                .map(|l| l.as_millis() as f64)
+                .unwrap_or_default(),
+            ),
+            ("throttled".to_string(), state.throttled as f64),
+          ]);
+
+          if state.gated {
+            limits.insert(
+              "concurrency".to_string(),
+              state.concurrency.floor().max(1.0),
+            );
+            limits.insert("in_flight".to_string(), state.in_flight as f64);
+          }
+
+          (host.clone(), limits)
+        })
+        .collect(),
+      _ => Default::default(),
+    }
+  }
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  /// a throttle with the bounds.
+  fn throttle(min_delay: u64, max_delay: u64, max_concurrency: usize) -> AdaptiveThrottle {
+    AdaptiveThrottle::new(ThrottleConfig {
+      min_delay: Duration::from_millis(min_delay),
+      max_delay: Duration::from_millis(max_delay),
+      max_concurrency,
+      target_latency: Duration::from_millis(100),
+    })
+  }
+
+  /// the state of the host.
+  fn state(throttle: &AdaptiveThrottle, host: &str) -> HostState {
+    throttle.hosts.lock().unwrap().get(host).cloned().unwrap()
+  }
+
+  #[test]
+  fn fast_responses_increase_concurrency_additively_up_to_max() {
+    let t = throttle(0, 1000, 4);
+    let fast = Some(Duration::from_millis(10));
+
+    assert!(t.record("a", 200, fast, None).is_none());
+    assert_eq!(state(&t, "a").concurrency, 2.0);
+    t.record("a", 200, fast, None);
+    assert_eq!(state(&t, "a").concurrency, 2.5);
+
+    for _ in 0..100 {
+      t.record("a", 200, fast, None);
+    }
+    assert_eq!(state(&t, "a").concurrency, 4.0);
+    assert_eq!(state(&t, "a").delay, Duration::ZERO);
+  }
+
+  #[test]
+  fn throttled_responses_decrease_multiplicatively_and_back_off() {
+    let t = throttle(0, 1000, 8);
+
+    for _ in 0..20 {
+      t.record("a", 200, None, None);
+    }
+    let before = state(&t, "a").concurrency;
+
+    let wait = t.record("a", 429, None, None);
+    let s = state(&t, "a");
+    assert_eq!(s.concurrency, before * THROTTLED_DECREASE);
+    assert_eq!(s.delay, BACKOFF_DELAY);
+    assert_eq!(wait, Some(BACKOFF_DELAY));
+    assert_eq!(s.throttled, 1);
+    assert!(s.retry_until.is_some());
+
+    t.record("a", 503, None, None);
+    assert_eq!(state(&t, "a").delay, BACKOFF_DELAY * 2);
+    assert_eq!(state(&t, "a").throttled, 2);
+
+    for _ in 0..10 {
+      t.record("a", 429, None, None);
+    }
+    assert_eq!(state(&t, "a").concurrency, 1.0);
+  }
+
+  #[test]
+  fn retry_after_sets_the_wait() {
+    let t = throttle(0, 5000, 8);
+    let wait = t.record("a", 429, None, Some(Duration::from_secs(2)));
+    assert_eq!(wait, Some(Duration::from_secs(2)));
+
+    let wait = t.record("a", 429, None, Some(Duration::from_secs(60)));
+    assert_eq!(wait, Some(Duration::from_secs(5)));
+  }
+
+  #[test]
+  fn slow_responses_decrease_concurrency_and_add_delay() {
+    let t = throttle(0, 1000, 8);
+
+    for _ in 0..10 {
+      t.record("a", 200, Some(Duration::from_millis(10)), None);
+    }
+    let before = state(&t, "a").concurrency;
+
+    t.record("a", 200, Some(Duration::from_secs(5)), None);
+    let s = state(&t, "a");
+    assert_eq!(s.concurrency, before * SLOW_DECREASE);
+    assert_eq!(s.delay, DELAY_STEP);
+  }
+
+  #[test]
+  fn delay_stays_within_bounds() {
+    let t = throttle(100, 400, 4);
+
+    for _ in 0..10 {
+      t.record("a", 429, None, None);
+      let delay = state(&t, "a").delay;
+      assert!(delay >= Duration::from_millis(100) && delay <= Duration::from_millis(400));
+    }
+    assert_eq!(state(&t, "a").delay, Duration::from_millis(400));
+
+    for _ in 0..100 {
+      t.record("a", 200, Some(Duration::from_millis(1)), None);
+    }
+    assert_eq!(state(&t, "a").delay, Duration::from_millis(100));
+
+    for _ in 0..100 {
+      t.record("b", 200, Some(Duration::from_secs(1)), None);
+    }
+    assert_eq!(state(&t, "b").delay, Duration::from_millis(400));
+  }
+
+  #[test]
+  fn invalid_bounds() {
+    assert!(throttle(0, 1000, 4).config.validate().is_ok());
+    assert!(throttle(2000, 1000, 4).config.validate().is_err());
+    assert!(throttle(0, 1000, 0).config.validate().is_err());
+  }
+
+  #[test]
+  fn concurrency_only_reported_for_gated_hosts() {
+    let t = throttle(0, 1000, 4);
+    t.record("a", 200, None, None);
+    let limits = t.limits();
+    assert!(!limits["a"].contains_key("concurrency"));
+    assert_eq!(limits["a"]["throttled"], 0.0);
+  }
+}
@@ -0,0 +1,581 @@
+use pyo3::exceptions::{PyIOError, PyValueError};
+use pyo3::prelude::*;
+use std::collections::HashSet;
+use std::fs::File;
+use std::io::{BufReader, BufWriter, Read, Write};
+use std::path::Path;
+
+/// the default false positive rate of the filter.
+pub const DEFAULT_FP_RATE: f64 = 0.001;
+/// the default amount of urls the first filter stage holds.
+pub const DEFAULT_CAPACITY: usize = 100_000;
+/// the capacity growth of every new stage.
+const GROWTH: usize = 2;
+/// the false positive tightening ratio of every new stage.
+const TIGHTENING: f64 = 0.5;
+/// the share of the target false positive rate the stages are sized for leaving room for the hash variance of small stages.
+const FP_MARGIN: f64 = 0.8;
+/// the file header of a saved filter.
+const MAGIC: &[u8; 4] = b"SPBF";
+/// the bytes of the file header with the magic, false positive rate, capacity and stage count.
+const HEADER_SIZE: u64 = 4 + 8 + 8 + 4;
+/// the bytes of a stage header with the bits, hashes, capacity and count.
+const STAGE_HEADER_SIZE: u64 = 8 + 4 + 8 + 8;
+/// the most hashes a stage can use.
+const MAX_HASHES: u32 = 64;
+
+/// check the false positive rate is a finite number in (0, 0.5].
+pub fn validate_fp_rate(fp_rate: f64) -> Result<f64, String> {
+  if fp_rate.is_finite() && fp_rate > 0.0 && fp_rate <= 0.5 {
+    Ok(fp_rate)
+  } else {
+    Err(format!(
+      "fp_rate must be greater than 0 and at most 0.5, got {}",
+      fp_rate
+    ))
+  }
+}
+
+/// a stable 64 bit hash of the bytes with the seed (FNV-1a with a splitmix64 finalizer).
+fn hash64(bytes: &[u8], seed: u64) -> u64 {
+  let mut h = 0xcbf29ce484222325u64 ^ seed;
+
+  for b in bytes {
+    h ^= *b as u64;
+    h = h.wrapping_mul(0x100000001b3);
+  }
+
+  h = (h ^ (h >> 30)).wrapping_mul(0xbf58476d1ce4e5b9);
+  h = (h ^ (h >> 27)).wrapping_mul(0x94d049bb133111eb);
+  h ^ (h >> 31)
+}
+
+/// a fixed size bloom filter stage.
+#[derive(Debug, Clone)]
+struct BloomStage {
+  /// the bit words.
+  words: Vec<u64>,
+  /// the amount of bits.
+  bits: u64,
+  /// the amount of hashes.
+  hashes: u32,
+  /// the amount of items the stage holds before a new stage is added.
+  capacity: u64,
+  /// the amount of items inserted.
+  count: u64,
+}
+
+impl BloomStage {
+  /// a new stage for the capacity and false positive rate.
+  fn new(capacity: u64, fp_rate: f64) -> Self {
+    let ln2 = std::f64::consts::LN_2;
+    // the tightened rate of late stages may underflow to 0.
+    let fp_rate = fp_rate.max(f64::MIN_POSITIVE);
+    let bits = ((-(capacity as f64) * fp_rate.ln()) / (ln2 * ln2))
+      .ceil()
+      .max(64.0) as u64;
+    let hashes = ((bits as f64 / capacity as f64) * ln2)
+      .round()
+      .clamp(1.0, MAX_HASHES as f64) as u32;
+
+    BloomStage {
+      words: vec![0; bits.div_ceil(64) as usize],
+      bits,
+      hashes,
+      capacity,
+      count: 0,
+    }
+  }
+
+  /// the bit positions of the hashes (double hashing mapped to the bits with a multiply shift).
+  fn positions(&self, h1: u64, h2: u64) -> impl Iterator<Item = u64> + '_ {
+    (0..self.hashes as u64).map(move |i| {
+      ((h1.wrapping_add(i.wrapping_mul(h2)) as u128 * self.bits as u128) >> 64) as u64
+    })
+  }
+
+  /// is the item possibly in the stage.
+  fn contains(&self, h1: u64, h2: u64) -> bool {
+    self
+      .positions(h1, h2)
+      .all(|p| self.words[(p / 64) as usize] & (1 << (p % 64)) != 0)
+  }
+
+  /// add the item to the stage.
+  fn insert(&mut self, h1: u64, h2: u64) {
+    let positions: Vec<u64> = self.positions(h1, h2).collect();
+
+    for p in positions {
+      self.words[(p / 64) as usize] |= 1 << (p % 64);
+    }
+
+    self.count += 1;
+  }
+
+  /// the expected false positive rate for the items inserted.
+  fn fp_rate(&self) -> f64 {
+    let k = self.hashes as f64;
+    (1.0 - (-k * self.count as f64 / self.bits as f64).exp()).powf(k)
+  }
+}
+
+/// a scalable bloom filter adding stages as it fills keeping the false positive rate bounded.
+#[derive(Debug, Clone)]
+pub struct ScalableBloom {
+  /// the target false positive rate.
+  fp_rate: f64,
+  /// the capacity of the first stage.
+  capacity: usize,
+  /// the filter stages.
+  stages: Vec<BloomStage>,
+}
+
+impl ScalableBloom {
+  /// a new scalable bloom filter. A false positive rate outside of (0, 0.5] uses the default rate.
+  pub fn new(fp_rate: f64, capacity: usize) -> Self {
+    let fp_rate = validate_fp_rate(fp_rate).unwrap_or(DEFAULT_FP_RATE);
+    let capacity = capacity.max(1);
+
+    ScalableBloom {
+      fp_rate,
+      capacity,
+      stages: vec![BloomStage::new(
+        capacity as u64,
+        fp_rate * FP_MARGIN * (1.0 - TIGHTENING),
+      )],
+    }
+  }
+
+  /// is the item possibly seen.
+  pub fn contains(&self, item: &str) -> bool {
+    let h1 = hash64(item.as_bytes(), 0);
+    let h2 = hash64(item.as_bytes(), h1) | 1;
+    self.stages.iter().any(|s| s.contains(h1, h2))
+  }
+
+  /// add the item returning true if it was not seen.
+  pub fn insert(&mut self, item: &str) -> bool {
+    let h1 = hash64(item.as_bytes(), 0);
+    let h2 = hash64(item.as_bytes(), h1) | 1;
+
+    if self.stages.iter().any(|s| s.contains(h1, h2)) {
+      return false;
+    }
+
+    let full = match self.stages.last() {
+      Some(s) => s.count >= s.capacity,
+      _ => true,
+    };
+
+    if full {
+      let stage = self.stages.len() as i32;
+      self.stages.push(BloomStage::new(
+        (self.capacity * GROWTH.pow(stage as u32)) as u64,
+        self.fp_rate * FP_MARGIN * (1.0 - TIGHTENING) * TIGHTENING.powi(stage),
+      ));
+    }
+
+    if let Some(s) = self.stages.last_mut() {
+      s.insert(h1, h2);
+    }
+
+    true
+  }
+
+  /// the amount of items inserted.
+  pub fn len(&self) -> usize {
+    self.stages.iter().map(|s| s.count as usize).sum()
+  }
+
+  /// is the filter empty.
+  pub fn is_empty(&self) -> bool {
+    self.len() == 0
+  }
+
+  /// the bytes used by the filter bits.
+  pub fn memory_usage(&self) -> usize {
+    self.stages.iter().map(|s| s.words.len() * 8).sum()
+  }
+
+  /// the estimated false positive rate for the items inserted.
+  pub fn estimated_fp_rate(&self) -> f64 {
+    1.0
+      - self
+        .stages
+        .iter()
+        .map(|s| 1.0 - s.fp_rate())
+        .product::<f64>()
+  }
+
+  /// save the filter to the path.
+  pub fn save(&self, path: &Path) -> std::io::Result<()> {
+    let mut w = BufWriter::new(File::create(path)?);
+
+    w.write_all(MAGIC)?;
+    w.write_all(&self.fp_rate.to_le_bytes())?;
+    w.write_all(&(self.capacity as u64).to_le_bytes())?;
+    w.write_all(&(self.stages.len() as u32).to_le_bytes())?;
+
+    for s in &self.stages {
+      w.write_all(&s.bits.to_le_bytes())?;
+      w.write_all(&s.hashes.to_le_bytes())?;
+      w.write_all(&s.capacity.to_le_bytes())?;
+      w.write_all(&s.count.to_le_bytes())?;
+      for word in &s.words {
+        w.write_all(&word.to_le_bytes())?;
+      }
+    }
+
+    w.flush()
+  }
+
+  /// load a filter saved to the path. The stage sizes are checked against the file length before allocating.
+  pub fn load(path: &Path) -> std::io::Result<Self> {
+    let file = File::open(path)?;
+    let mut remaining = file.metadata()?.len();
+    let mut r = BufReader::new(file);
+    let mut magic = [0u8; 4];
+    r.read_exact(&mut magic)?;
+
+    if &magic != MAGIC {
+      return Err(invalid_data("not a visited filter file"));
+    }
+
+    let fp_rate = f64::from_le_bytes(read_array(&mut r)?);
+    let capacity = u64::from_le_bytes(read_array(&mut r)?) as usize;
+    let count = u32::from_le_bytes(read_array(&mut r)?);
+    remaining = remaining.saturating_sub(HEADER_SIZE);
+
+    if validate_fp_rate(fp_rate).is_err() || capacity == 0 {
+      return Err(invalid_data("invalid visited filter header"));
+    }
+    if count as u64 * STAGE_HEADER_SIZE > remaining {
+      return Err(invalid_data("visited filter stages exceed the file"));
+    }
+
+    let mut stages = Vec::with_capacity(count as usize);
+
+    for _ in 0..count {
+      let bits = u64::from_le_bytes(read_array(&mut r)?);
+      let hashes = u32::from_le_bytes(read_array(&mut r)?);
+      let capacity = u64::from_le_bytes(read_array(&mut r)?);
+      let count = u64::from_le_bytes(read_array(&mut r)?);
+      remaining = remaining.saturating_sub(STAGE_HEADER_SIZE);
+
+      if bits == 0 || hashes == 0 || hashes > MAX_HASHES {
+        return Err(invalid_data("invalid visited filter stage"));
+      }
+
+      let words_len = bits.div_ceil(64);
+
+      if words_len * 8 > remaining {
+        return Err(invalid_data("visited filter bits exceed the file"));
+      }
+
+      remaining -= words_len * 8;
+
+      let mut words = vec![0u64; words_len as usize];
+
+      for word in words.iter_mut() {
+        *word = u64::from_le_bytes(read_array(&mut r)?);
+      }
+
+      stages.push(BloomStage {
+        words,
+        bits,
+        hashes,
+        capacity,
+        count,
+      });
+    }
+
+    if stages.is_empty() || remaining != 0 {
+      return Err(invalid_data("invalid visited filter length"));
+    }
+
+    Ok(ScalableBloom {
+      fp_rate,
+      capacity,
+      stages,
+    })
+  }
+}
+
+/// an invalid data error.
+fn invalid_data(message: &str) -> std::io::Error {
+  std::io::Error::new(std::io::ErrorKind::InvalidData, message)
+}
+
+/// read a fixed amount of bytes.
+fn read_array<const N: usize>(r: &mut impl Read) -> std::io::Result<[u8; N]> {
+  let mut buf = [0u8; N];
+  r.read_exact(&mut buf)?;
+  Ok(buf)
+}
+
+/// the visited urls kept exactly or in a bloom filter.
+#[derive(Debug, Clone)]
+pub enum Visited {
+  /// every url kept as a string.
+  Exact(HashSet<String>),
+  /// the urls kept in a scalable bloom filter.
+  Bloom(ScalableBloom),
+}
+
+impl Default for Visited {
+  fn default() -> Self {
+    Visited::Exact(HashSet::new())
+  }
+}
+
+impl Visited {
+  /// add the url returning true if it was not seen.
+  pub fn insert(&mut self, url: &str) -> bool {
+    match self {
+      Visited::Exact(set) => set.insert(url.to_string()),
+      Visited::Bloom(filter) => filter.insert(url),
+    }
+  }
+
+  /// the amount of urls inserted.
+  pub fn len(&self) -> usize {
+    match self {
+      Visited::Exact(set) => set.len(),
+      Visited::Bloom(filter) => filter.len(),
+    }
+  }
+
+  /// is the set empty.
+  pub fn is_empty(&self) -> bool {
+    self.len() == 0
+  }
+
+  /// the approximate bytes used by the urls.
+  pub fn memory_usage(&self) -> usize {
+    match self {
+      Visited::Exact(set) => set
+        .iter()
+        .map(|u| u.capacity() + std::mem::size_of::<String>())
+        .sum(),
+      Visited::Bloom(filter) => filter.memory_usage(),
+    }
+  }
+
+  /// the estimated false positive rate.
+  pub fn fp_rate(&self) -> f64 {
+    match self {
+      Visited::Exact(_) => 0.0,
+      Visited::Bloom(filter) => filter.estimated_fp_rate(),
+    }
+  }
+}
+
+/// a probabilistic visited set holding millions of urls in a fraction of the memory. May report a url not seen as seen at the false positive rate. Website crawls keep the exact visited set of spider, the filter replaces the urls kept in page events.
+#[pyclass]
+pub struct VisitedFilter {
+  /// the filter.
+  pub inner: ScalableBloom,
+}
+
+#[pymethods]
+impl VisitedFilter {
+  /// a new visited filter loading the file at the path if it exists. Raises a ValueError if the false positive rate is not in (0, 0.5].
+  #[new]
+  #[pyo3(signature = (fp_rate=None, capacity=None, path=None))]
+  pub fn new(
+    fp_rate: Option<f64>,
+    capacity: Option<usize>,
+    path: Option<String>,
+  ) -> PyResult<Self> {
+    let fp_rate =
+      validate_fp_rate(fp_rate.unwrap_or(DEFAULT_FP_RATE)).map_err(PyValueError::new_err)?;
+    let inner = match path {
+      Some(p) if Path::new(&p).exists() => {
+        ScalableBloom::load(Path::new(&p)).map_err(|e| PyIOError::new_err(e.to_string()))?
+      }
+      _ => ScalableBloom::new(fp_rate, capacity.unwrap_or(DEFAULT_CAPACITY)),
+    };
+
+    Ok(VisitedFilter { inner })
+  }
+
+  /// add the url returning true if it was not seen.
+  pub fn insert(&mut self, url: &str) -> bool {
+    self.inner.insert(url)
+  }
+
+  fn __contains__(&self, url: &str) -> bool {
+    self.inner.contains(url)
+  }
+
+  fn __len__(&self) -> usize {
+    self.inner.len()
+  }
+
+  /// the bytes used by the filter.
+  #[getter]
+  pub fn memory_usage(&self) -> usize {
+    self.inner.memory_usage()
+  }
+
+  /// the estimated false positive rate for the urls inserted.
+  #[getter]
+  pub fn fp_rate(&self) -> f64 {
+    self.inner.estimated_fp_rate()
+  }
+
+  /// save the filter to the path to reuse between runs.
+  pub fn save(&self, path: String) -> PyResult<()> {
+    self
+      .inner
+      .save(Path::new(&path))
+      .map_err(|e| PyIOError::new_err(e.to_string()))
+  }
+}
+
+#[cfg(test)]
+mod tests {
+  use super::*;
+
+  /// a unique temp file path.
+  fn temp_path(name: &str) -> std::path::PathBuf {
+    std::env::temp_dir().join(format!("spider_rs-{}-{}.bin", name, std::process::id()))
+  }
+
+  #[test]
+  fn invalid_fp_rates() {
+    assert!(validate_fp_rate(0.001).is_ok());
+    assert!(validate_fp_rate(0.5).is_ok());
+
+    for fp_rate in [0.0, -0.1, 0.6, f64::NAN, f64::INFINITY] {
+      assert!(validate_fp_rate(fp_rate).is_err());
+    }
+
+    assert_eq!(ScalableBloom::new(f64::NAN, 10).fp_rate, DEFAULT_FP_RATE);
+  }
+
+  #[test]
+  fn tiny_fp_rates_cap_the_hashes_and_still_load() {
+    let path = temp_path("tiny");
+    let mut filter = ScalableBloom::new(1e-300, 10);
+
+    for i in 0..100 {
+      filter.insert(&format!("https://example.com/{i}"));
+    }
+    assert!(filter.stages.iter().all(|s| s.hashes <= MAX_HASHES));
+
+    filter.save(&path).unwrap();
+    let loaded = ScalableBloom::load(&path).unwrap();
+    let _ = std::fs::remove_file(&path);
+
+    assert_eq!(loaded.len(), 100);
+    assert!(loaded.contains("https://example.com/99"));
+  }
+
+  #[test]
+  fn insert_and_contains() {
+    let mut filter = ScalableBloom::new(0.01, 100);
+
+    assert!(filter.insert("https://example.com/a"));
+    assert!(!filter.insert("https://example.com/a"));
+    assert!(filter.contains("https://example.com/a"));
+    assert_eq!(filter.len(), 1);
+  }
+
+  #[test]
+  fn stages_grow_past_capacity() {
+    let mut filter = ScalableBloom::new(0.01, 1000);
+    let first = filter.memory_usage();
+
+    for i in 0..1000 {
+      filter.insert(&format!("https://example.com/{i}"));
+    }
+    assert_eq!(filter.stages.len(), 1);
+
+    for i in 1000..10_000 {
+      filter.insert(&format!("https://example.com/{i}"));
+    }
+    assert!(filter.stages.len() > 1);
+    assert!(filter.memory_usage() > first);
+
+    for s in &filter.stages[..filter.stages.len() - 1] {
+      assert!(s.count >= s.capacity);
+    }
+    for i in 0..10_000 {
+      assert!(filter.contains(&format!("https://example.com/{i}")));
+    }
+  }
+
+  #[test]
+  fn fp_rate_stays_under_target_past_capacity() {
+    let target = 0.01;
+    let mut filter = ScalableBloom::new(target, 1000);
+    let n = 50_000;
+
+    for i in 0..n {
+      filter.insert(&format!("https://example.com/seen/{i}"));
+    }
+
+    assert!(filter.estimated_fp_rate() < target);
+
+    let probes = 100_000;
+    let false_positives = (0..probes)
+      .filter(|i| filter.contains(&format!("https://example.com/unseen/{i}")))
+      .count();
+
+    assert!((false_positives as f64 / probes as f64) < target);
+  }
+
+  #[test]
+  fn save_load_round_trip() {
+    let path = temp_path("round-trip");
+    let mut filter = ScalableBloom::new(0.001, 100);
+
+    for i in 0..500 {
+      filter.insert(&format!("https://example.com/{i}"));
+    }
+    filter.save(&path).unwrap();
+
+    let mut loaded = ScalableBloom::load(&path).unwrap();
+    std::fs::remove_file(&path).unwrap();
+
+    assert_eq!(loaded.len(), filter.len());
+    assert_eq!(loaded.stages.len(), filter.stages.len());
+    assert_eq!(loaded.memory_usage(), filter.memory_usage());
+    assert_eq!(loaded.estimated_fp_rate(), filter.estimated_fp_rate());
+
+    for i in 0..500 {
+      assert!(!loaded.insert(&format!("https://example.com/{i}")));
+    }
+    assert!(loaded.insert("https://example.com/new"));
+  }
+
+  #[test]
+  fn load_rejects_invalid_files() {
+    let path = temp_path("invalid");
+    let filter = ScalableBloom::new(0.01, 100);
+    filter.save(&path).unwrap();
+    let bytes = std::fs::read(&path).unwrap();
+
+    // truncated bits.
+    std::fs::write(&path, &bytes[..bytes.len() - 8]).unwrap();
+    assert!(ScalableBloom::load(&path).is_err());
+
+    // bits larger than the file.
+    let mut huge = bytes.clone();
+    huge[HEADER_SIZE as usize..HEADER_SIZE as usize + 8].copy_from_slice(&u64::MAX.to_le_bytes());
+    std::fs::write(&path, &huge).unwrap();
+    assert!(ScalableBloom::load(&path).is_err());
+
+    // trailing bytes.
+    let mut trailing = bytes.clone();
+    trailing.push(0);
+    std::fs::write(&path, &trailing).unwrap();
+    assert!(ScalableBloom::load(&path).is_err());
+
+    std::fs::write(&path, b"nope").unwrap();
+    assert!(ScalableBloom::load(&path).is_err());
+
+    std::fs::remove_file(&path).unwrap();
+  }
+}
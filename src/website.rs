@@ -1,12 +1,26 @@
-use crate::{new_page, pydict_to_json_value, NPage, BUFFER};
+use crate::contacts::{discover_contacts, NContacts, DEFAULT_MAX_PAGES};
+use crate::coordinator::JobSpec;
+use crate::link_extractor::LinkExtractor;
+use crate::npage::PageFields;
+use crate::page_store::{
+  PageSequence, PageStore, PageStoreConfig, PageWriter, DEFAULT_MEMORY_LIMIT,
+};
+use crate::throttle::{AdaptiveThrottle, ThrottleConfig};
+use crate::{new_page, pydict_to_json_value, NPage, PageOptions, BUFFER};
 use indexmap::IndexMap;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3::types::PyDict;
+use pyo3::IntoPyObjectExt;
 use spider::compact_str::CompactString;
 use spider::configuration::{WaitForDelay, WaitForIdleNetwork, WaitForSelector};
 use spider::tokio::select;
+use spider::tokio::sync::broadcast::{error::RecvError, error::TryRecvError, Receiver};
 use spider::tokio::task::JoinHandle;
 use spider::utils::shutdown;
+use std::collections::HashMap;
+use std::future::Future;
+use std::sync::{Arc, Mutex};
 use std::time::Duration;
 
 /// A website holding the inner spider::website::Website from Rust fit for python.
@@ -22,6 +36,14 @@ pub struct Website {
   raw_content: bool,
   /// is the crawl running in the background.
   running_in_background: bool, // /// the file handle for storing data
+  /// the bounded page store used when scraping.
+  page_store: Option<Arc<Mutex<PageStore>>>,
+  /// extract ids and links from the pages.
+  link_extractor: Option<Arc<LinkExtractor>>,
+  /// the page fields to materialize.
+  page_fields: Option<Arc<PageFields>>,
+  /// adapt the per host concurrency and delay.
+  throttle: Option<Arc<AdaptiveThrottle>>,
 }
 
 #[pymethods]
@@ -36,6 +58,10 @@ impl Website {
       crawl_handles: IndexMap::new(),
       raw_content: raw_content.unwrap_or_default(),
       running_in_background: false, // file_handle: None,
+      page_store: None,
+      link_extractor: None,
+      page_fields: None,
+      throttle: None,
     }
   }
 
@@ -50,11 +76,11 @@ impl Website {
       .inner
       .subscribe(*BUFFER / 2)
       .expect("sync feature should be enabled");
-    let raw_content = slf.raw_content;
+    let page_options = slf.page_options();
 
     let handle = pyo3_async_runtimes::tokio::get_runtime().spawn(async move {
       while let Ok(res) = rx2.recv().await {
-        let page = new_page(&res, raw_content);
+        let page = new_page(&res, &page_options);
         Python::with_gil(|py| {
           let _ = on_page_event.call(py, (page, 0), None);
         });
@@ -150,7 +176,7 @@ impl Website {
     // only run in background if on_page_event is handled for streaming.
     let background = background.is_some() && background.unwrap_or_default();
     let headless = headless.is_some() && headless.unwrap_or_default();
-    let raw_content = slf.raw_content;
+    let page_options = slf.page_options();
 
     if background {
       slf.running_in_background = background;
@@ -167,7 +193,7 @@ impl Website {
 
           let handle = rt.spawn(async move {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
               Python::with_gil(|py| {
                 let _ = callback.call(py, (page,), None);
               });
@@ -205,7 +231,7 @@ impl Website {
 
           let f1 = async {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
               let _ = callback.call(py, (page,), None);
             }
           };
@@ -272,7 +298,7 @@ impl Website {
   ) {
     // only run in background if on_page_event is handled for streaming.
     let background = background.is_some() && background.unwrap_or_default();
-    let raw_content = slf.raw_content;
+    let page_options = slf.page_options();
 
     if background {
       slf.running_in_background = background;
@@ -289,7 +315,7 @@ impl Website {
 
           let handle = rt.spawn(async move {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
               Python::with_gil(|py| {
                 let _ = callback.call(py, (page,), None);
               });
@@ -323,7 +349,7 @@ impl Website {
 
           let f1 = async {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
               let _ = callback.call(py, (page,), None);
             }
           };
@@ -378,13 +404,18 @@ impl Website {
     headless: Option<bool>,
   ) {
     let headless = headless.is_some() && headless.unwrap_or_default();
-    let raw_content = slf.raw_content;
+    let page_options = slf.page_options();
     let background = background.is_some() && background.unwrap_or_default();
 
     if background {
       slf.running_in_background = background;
     }
 
+    if let Some(store) = slf.page_store.clone() {
+      Website::scrape_with_store(slf, store, on_page_event, background, headless);
+      return;
+    }
+
     match on_page_event {
       Some(callback) => {
         if background {
@@ -396,7 +427,7 @@ impl Website {
 
           let handle = rt.spawn(async move {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
 
               // todo: remove global lock page events
               Python::with_gil(|py| {
@@ -436,7 +467,7 @@ impl Website {
 
           let f1 = async {
             while let Ok(res) = rx2.recv().await {
-              let page = new_page(&res, raw_content);
+              let page = new_page(&res, &page_options);
               let _ = callback.call(py, (page,), None);
             }
           };
@@ -494,6 +525,69 @@ impl Website {
     }
   }
 
+  /// crawl the website or urls focused on finding the contacts. The links most likely to hold the contacts are fetched first and each domain stops once an email is found or max_pages are fetched. Uses the website configuration including the user agent, headers, proxies, robots.txt and delay, respects the depth limit and defaults max_pages to the `*` budget when set.
+  #[pyo3(signature = (urls=None, max_pages=None))]
+  pub fn crawl_contacts(
+    slf: PyRef<'_, Self>,
+    urls: Option<Vec<String>>,
+    max_pages: Option<usize>,
+  ) -> Vec<NContacts> {
+    let urls = match urls {
+      Some(u) => u,
+      _ => vec![slf.inner.get_url().inner().to_string()],
+    };
+    let configuration = Arc::new(spider::configuration::Configuration::clone(
+      &slf.inner.configuration,
+    ));
+    let max_pages = max_pages
+      .or_else(|| {
+        configuration
+          .budget
+          .as_ref()
+          .and_then(|budget| budget.get(&spider::CaseInsensitiveString::from("*")))
+          .map(|pages| *pages as usize)
+      })
+      .unwrap_or(DEFAULT_MAX_PAGES);
+    let throttle = slf.throttle.clone();
+
+    slf.py().allow_threads(|| {
+      pyo3_async_runtimes::tokio::get_runtime().block_on(async move {
+        let semaphore = std::sync::Arc::new(spider::tokio::sync::Semaphore::new(*BUFFER));
+        let mut tasks = spider::tokio::task::JoinSet::new();
+        // keep a result for every url even when the discovery task fails.
+        let mut contacts: Vec<NContacts> = urls
+          .iter()
+          .map(|url| NContacts {
+            url: url.clone(),
+            ..Default::default()
+          })
+          .collect();
+
+        for (i, url) in urls.into_iter().enumerate() {
+          let semaphore = semaphore.clone();
+          let configuration = configuration.clone();
+          let throttle = throttle.clone();
+
+          tasks.spawn(async move {
+            let _permit = semaphore.acquire_owned().await;
+            (
+              i,
+              discover_contacts(url, configuration, max_pages, throttle).await,
+            )
+          });
+        }
+
+        while let Some(res) = tasks.join_next().await {
+          if let Ok((i, c)) = res {
+            contacts[i] = c;
+          }
+        }
+
+        contacts
+      })
+    })
+  }
+
   /// run a cron job.
   #[pyo3(signature = (on_page_event=None))]
   pub fn run_cron(mut slf: PyRefMut<'_, Self>, on_page_event: Option<PyObject>) -> Cron {
@@ -503,13 +597,13 @@ impl Website {
           .inner
           .subscribe(*BUFFER / 2)
           .expect("sync feature should be enabled");
-        let raw_content = slf.raw_content;
+        let page_options = slf.page_options();
         let rt = pyo3_async_runtimes::tokio::get_runtime();
 
         let handler = rt.spawn(async move {
           while let Ok(res) = rx2.recv().await {
             Python::with_gil(|py| {
-              let _ = callback.call(py, (new_page(&res, raw_content),), None);
+              let _ = callback.call(py, (new_page(&res, &page_options),), None);
             });
           }
         });
@@ -565,18 +659,22 @@ impl Website {
     map
   }
 
-  /// get all the pages of a website - requires calling website.scrape
-  pub fn get_pages(&self) -> Vec<NPage> {
+  /// get all the pages of a website - requires calling website.scrape. When the page store is enabled a lazy sequence is returned that loads the page on access.
+  pub fn get_pages(&self, py: Python<'_>) -> PyResult<PyObject> {
+    if let Some(store) = &self.page_store {
+      return PageSequence::new(store.clone()).into_py_any(py);
+    }
+
     let mut pages: Vec<NPage> = Vec::new();
-    let raw_content = self.raw_content;
+    let page_options = self.page_options();
 
     if let Some(p) = self.inner.get_pages() {
       for page in p.iter() {
-        pages.push(new_page(page, raw_content));
+        pages.push(new_page(page, &page_options));
       }
     }
 
-    pages
+    pages.into_py_any(py)
   }
 
   /// drain all links from storing
@@ -595,6 +693,27 @@ impl Website {
   /// clear all links and page data
   pub fn clear(&mut self) {
     self.inner.clear();
+    if let Some(store) = &self.page_store {
+      if let Ok(mut store) = store.lock() {
+        store.clear();
+      }
+    }
+  }
+
+  /// Keep scraped pages in a bounded memory window spilling the rest to a segment file on disk.
+  #[pyo3(signature = (memory_limit=None, directory=None, compress=None))]
+  pub fn with_page_store(
+    mut slf: PyRefMut<'_, Self>,
+    memory_limit: Option<usize>,
+    directory: Option<String>,
+    compress: Option<bool>,
+  ) -> PyRefMut<'_, Self> {
+    slf.page_store = Some(Arc::new(Mutex::new(PageStore::new(PageStoreConfig {
+      memory_limit: memory_limit.unwrap_or(DEFAULT_MEMORY_LIMIT),
+      directory: directory.map(Into::into),
+      compress: compress.unwrap_or_default(),
+    }))));
+    slf
   }
 
   /// Set HTTP headers for request using [reqwest::header::HeaderMap](https://docs.rs/reqwest/latest/reqwest/header/struct.HeaderMap.html).
@@ -917,6 +1036,49 @@ impl Website {
     slf
   }
 
+  /// Extract ids and links from the page bytes with regex patterns checked in one pass. Named groups are returned on `page.extracted` and substituted into the `{name}` placeholders of the url template. Raises a ValueError if a pattern or page glob is invalid.
+  #[pyo3(signature = (patterns=None, pages=None, template=None))]
+  pub fn with_link_extractor(
+    mut slf: PyRefMut<'_, Self>,
+    patterns: Option<Vec<String>>,
+    pages: Option<Vec<String>>,
+    template: Option<String>,
+  ) -> PyResult<PyRefMut<'_, Self>> {
+    slf.link_extractor = match patterns {
+      Some(p) => Some(Arc::new(
+        LinkExtractor::new(&p, pages.as_deref(), template).map_err(PyValueError::new_err)?,
+      )),
+      _ => None,
+    };
+
+    Ok(slf)
+  }
+
+  /// Only build the page fields named for the page events. The `url` and `status_code` are always set. Use `headers` to keep only the header names listed and `max_body_size` to cap the content bytes, either one also selects its field. All fields are built when no options are set.
+  #[pyo3(signature = (fields=None, headers=None, max_body_size=None))]
+  pub fn with_page_fields(
+    mut slf: PyRefMut<'_, Self>,
+    fields: Option<Vec<String>>,
+    headers: Option<Vec<String>>,
+    max_body_size: Option<usize>,
+  ) -> PyRefMut<'_, Self> {
+    let headers = headers.filter(|h| !h.is_empty());
+
+    slf.page_fields = if fields.is_none() && headers.is_none() && max_body_size.is_none() {
+      None
+    } else {
+      let (page_fields, unknown) = PageFields::new(fields.as_deref(), headers, max_body_size);
+
+      if !unknown.is_empty() {
+        spider::utils::log("Unknown page fields", unknown.join(","));
+      }
+
+      Some(Arc::new(page_fields))
+    };
+
+    slf
+  }
+
   /// Use network interception for the request to only allow content that matches the host. If the content is from a 3rd party it needs to be part of our include list.
   pub fn with_chrome_intercept(
     mut slf: PyRefMut<'_, Self>,
@@ -988,6 +1150,46 @@ impl Website {
     slf
   }
 
+  /// Adapt the delay and in-flight requests per host from the response latency, 429/503 responses and Retry-After (AIMD) within the bounds in ms for crawl_contacts, which gates every request per host with the limits. The min delay defaults to the website delay and the learned delay replaces it between the pages of crawl_contacts. Spider crawls expose no per request hook so crawl and scrape are not throttled. Raises a ValueError if min_delay is greater than max_delay or max_concurrency is 0.
+  #[pyo3(signature = (enabled, min_delay=None, max_delay=None, max_concurrency=None, target_latency=None))]
+  pub fn with_adaptive_throttle(
+    mut slf: PyRefMut<'_, Self>,
+    enabled: bool,
+    min_delay: Option<u64>,
+    max_delay: Option<u64>,
+    max_concurrency: Option<usize>,
+    target_latency: Option<u64>,
+  ) -> PyResult<PyRefMut<'_, Self>> {
+    slf.throttle = if enabled {
+      let defaults = ThrottleConfig::default();
+      let min_delay = Duration::from_millis(min_delay.unwrap_or(slf.inner.configuration.delay));
+      let config = ThrottleConfig {
+        min_delay,
+        max_delay: max_delay
+          .map(Duration::from_millis)
+          .unwrap_or(defaults.max_delay.max(min_delay)),
+        max_concurrency: max_concurrency.unwrap_or(defaults.max_concurrency),
+        target_latency: target_latency
+          .map(Duration::from_millis)
+          .unwrap_or(defaults.target_latency),
+      };
+      config.validate().map_err(PyValueError::new_err)?;
+
+      Some(Arc::new(AdaptiveThrottle::new(config)))
+    } else {
+      None
+    };
+    Ok(slf)
+  }
+
+  /// get the current adaptive limits by host learned by crawl_contacts with the delay and latency in ms, the throttled responses, the concurrency and in-flight requests.
+  pub fn get_host_limits(&self) -> HashMap<String, HashMap<String, f64>> {
+    match &self.throttle {
+      Some(throttle) => throttle.limits(),
+      _ => Default::default(),
+    }
+  }
+
   /// Use proxies for request.
   #[pyo3(signature = (proxies=None))]
   pub fn with_proxies(
@@ -1014,6 +1216,178 @@ impl Website {
   }
 }
 
+impl Website {
+  /// the options used to build the pages.
+  fn page_options(&self) -> PageOptions {
+    PageOptions {
+      raw: self.raw_content,
+      link_extractor: self.link_extractor.clone(),
+      fields: self.page_fields.clone(),
+    }
+  }
+
+  /// the crawl job for the coordinator workers built from the website configuration. Raises a ValueError if the website uses options the workers do not support.
+  pub(crate) fn job_spec(&self, headless: bool, concurrency: usize) -> PyResult<JobSpec> {
+    if self.throttle.is_some() {
+      return Err(PyValueError::new_err(
+        "the adaptive throttle is not supported by the coordinator",
+      ));
+    }
+
+    Ok(JobSpec {
+      configuration: spider::configuration::Configuration::clone(&self.inner.configuration),
+      raw: self.raw_content,
+      link_extractor: self.link_extractor.as_ref().map(|e| e.spec().clone()),
+      fields: self.page_fields.as_deref().cloned(),
+      headless,
+      concurrency,
+    })
+  }
+
+  /// scrape a website streaming the pages into the page store instead of holding them on the website.
+  fn scrape_with_store(
+    mut slf: PyRefMut<'_, Self>,
+    store: Arc<Mutex<PageStore>>,
+    on_page_event: Option<PyObject>,
+    background: bool,
+    headless: bool,
+  ) {
+    let page_options = slf.page_options();
+    let rt = pyo3_async_runtimes::tokio::get_runtime();
+    let mut writer = PageWriter::spawn(store.clone());
+
+    if background {
+      let mut website = slf.inner.clone();
+      let mut rx2 = website
+        .subscribe(*BUFFER / 2)
+        .expect("sync feature should be enabled");
+      let mut guard = website.subscribe_guard();
+
+      let crawl_id = match slf.crawl_handles.last() {
+        Some(handle) => handle.0 + 1,
+        _ => 0,
+      };
+
+      let crawl_handle = rt.spawn(async move {
+        let crawl = async {
+          if headless {
+            website.crawl().await;
+          } else {
+            website.crawl_raw().await;
+          }
+        };
+        let on_page = |res: &spider::page::Page| {
+          store_page(res, &page_options, &on_page_event, &writer);
+          if let Some(guard) = guard.as_mut() {
+            guard.inc();
+          }
+        };
+        let skipped = forward_pages(&mut rx2, crawl, on_page).await;
+
+        let _ = spider::tokio::task::spawn_blocking(move || {
+          writer.finish();
+          finish_store(&store, skipped);
+        })
+        .await;
+      });
+
+      slf.crawl_handles.insert(crawl_id, crawl_handle);
+    } else {
+      let mut rx2 = slf
+        .inner
+        .subscribe(*BUFFER / 2)
+        .expect("sync feature should be enabled");
+      let mut guard = slf.inner.subscribe_guard();
+
+      let skipped = rt.block_on(async {
+        let crawl = async {
+          if headless {
+            slf.inner.crawl().await;
+          } else {
+            slf.inner.crawl_raw().await;
+          }
+        };
+        let on_page = |res: &spider::page::Page| {
+          store_page(res, &page_options, &on_page_event, &writer);
+          if let Some(guard) = guard.as_mut() {
+            guard.inc();
+          }
+        };
+        forward_pages(&mut rx2, crawl, on_page).await
+      });
+
+      writer.finish();
+      finish_store(&store, skipped);
+    }
+  }
+}
+
+/// build the page calling the page event and queue it for the page store.
+fn store_page(
+  res: &spider::page::Page,
+  page_options: &PageOptions,
+  on_page_event: &Option<PyObject>,
+  writer: &PageWriter,
+) {
+  let page = new_page(res, page_options);
+
+  if let Some(callback) = on_page_event {
+    let p = page.clone();
+    Python::with_gil(|py| {
+      let _ = callback.call(py, (p,), None);
+    });
+  }
+
+  spider::tokio::task::block_in_place(|| writer.send(page));
+}
+
+/// record the pages the crawl dropped before reaching the page store.
+fn finish_store(store: &Mutex<PageStore>, skipped: u64) {
+  if let Ok(mut store) = store.lock() {
+    store.add_skipped(skipped as usize);
+  }
+}
+
+/// forward the pages received while the crawl runs and drain the pages left once it completes. Returns the amount of pages dropped because the receiver lagged behind the crawl.
+pub(crate) async fn forward_pages<F: Future<Output = ()>>(
+  rx2: &mut Receiver<spider::page::Page>,
+  crawl: F,
+  mut on_page: impl FnMut(&spider::page::Page),
+) -> u64 {
+  let mut skipped = 0;
+
+  {
+    let receive = async {
+      loop {
+        match rx2.recv().await {
+          Ok(res) => on_page(&res),
+          Err(RecvError::Lagged(n)) => skipped += n,
+          Err(_) => break,
+        }
+      }
+    };
+
+    select! {
+      _ = receive => {}
+      _ = crawl => {}
+    }
+  }
+
+  loop {
+    match rx2.try_recv() {
+      Ok(res) => on_page(&res),
+      Err(TryRecvError::Lagged(n)) => skipped += n,
+      Err(_) => break,
+    }
+  }
+
+  if skipped > 0 {
+    spider::utils::log("pages skipped by lagging subscription", skipped.to_string());
+  }
+
+  skipped
+}
+
 /// a runner for handling crons
 #[pyclass]
 pub struct Cron {
@@ -0,0 +1,119 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+
+spider_rs = pytest.importorskip("spider_rs")
+
+# the links of every page served by the local site.
+PAGES = {"/": ["/a", "/b"], "/a": ["/c"], "/b": ["/"], "/c": []}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        links = PAGES.get(self.path)
+
+        if links is None:
+            self.send_error(404)
+            return
+
+        body = "".join(f'<a href="{link}">{link}</a>' for link in links)
+        body = f"<html><body>{body}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def paths(urls):
+    return {urlparse(url).path or "/" for url in urls}
+
+
+def totals(stats):
+    return {key: sum(s[key] for s in stats.values()) for key in ("assigned", "finished", "pages", "lost")}
+
+
+def test_shard_by_host_merges_the_site(site):
+    coordinator = spider_rs.Coordinator(spider_rs.Website(site), 2)
+    result = coordinator.crawl([site])
+
+    assert paths(result.links) == set(PAGES)
+    assert len(coordinator.stats) == 2
+    assert totals(coordinator.stats) == {"assigned": 1, "finished": 1, "pages": len(PAGES), "lost": 0}
+
+
+def test_shard_by_url_spreads_the_pages(site):
+    website = spider_rs.Website(site).with_depth(5)
+    coordinator = spider_rs.Coordinator(website, 2).with_shard_by("url")
+    result = coordinator.crawl([site + "/"])
+
+    assert paths(result.links) == set(PAGES)
+    assert len(result.links) == len(PAGES)
+    assert totals(coordinator.stats) == {
+        "assigned": len(PAGES),
+        "finished": len(PAGES),
+        "pages": len(PAGES),
+        "lost": 0,
+    }
+
+
+def test_link_extractor_runs_on_the_workers(site):
+    website = spider_rs.Website(site).with_link_extractor([r'href="/(?P<id>\w)"'])
+    result = spider_rs.Coordinator(website, 2).crawl([site])
+    pages = {urlparse(page.url).path or "/": page for page in result.pages}
+
+    assert pages["/"].extracted["id"] == ["a", "b"]
+    assert pages["/c"].extracted is None
+
+
+def test_workers_require_the_token(monkeypatch):
+    monkeypatch.delenv("SPIDER_RS_COORDINATOR_TOKEN", raising=False)
+
+    with pytest.raises(ValueError):
+        spider_rs.run_worker("127.0.0.1:1")
+
+
+def test_visited_filter_replaces_the_links(site, tmp_path):
+    path = str(tmp_path / "visited.bin")
+    website = spider_rs.Website(site).with_depth(5)
+    coordinator = spider_rs.Coordinator(website, 2).with_shard_by("url").with_visited_filter(0.001, 1000, path)
+    result = coordinator.crawl([site + "/"])
+
+    assert result.links == []
+    assert paths(page.url for page in result.pages) == set(PAGES)
+    assert coordinator.visited_stats["count"] >= len(PAGES)
+
+    # the next run only crawls the seed, every link was visited.
+    result = coordinator.crawl([site + "/"])
+    assert len(result.pages) == 1
+
+
+def test_visited_filter_requires_sharding_by_url(site):
+    coordinator = spider_rs.Coordinator(spider_rs.Website(site), 2).with_visited_filter()
+
+    with pytest.raises(ValueError):
+        coordinator.crawl([site])
+
+
+@pytest.mark.parametrize("fp_rate", [0.0, -1.0, 0.6, float("nan")])
+def test_visited_filter_rejects_invalid_fp_rates(fp_rate):
+    with pytest.raises(ValueError):
+        spider_rs.VisitedFilter(fp_rate)
+
+    with pytest.raises(ValueError):
+        spider_rs.Coordinator(spider_rs.Website("http://127.0.0.1")).with_visited_filter(fp_rate)